@@ -0,0 +1,250 @@
+"""
+Database micro-benchmarks.
+
+Generates a synthetic history (by default 100k users, 1M sessions and 20M
+messages; scale it with --scale), then times the hot public methods of
+database.Database and checks the plan of every statement they run with
+EXPLAIN QUERY PLAN. A full scan of one of the large tables fails the run.
+
+Usage:
+    python benchmarks/db_bench.py --scale 0.01     # quick run (1k users, 10k sessions, 200k messages)
+    python benchmarks/db_bench.py                  # full size; the dataset is generated once and reused
+    python benchmarks/db_bench.py --plans-only
+
+Exits with status 1 if a query plan check fails.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from database import Database, close_all_connections  # noqa: E402
+from utils import query_log  # noqa: E402
+
+# Tables that grow with usage; a hot query must never scan them
+LARGE_TABLES = {"users", "chat_sessions", "messages", "relay_messages", "fsm_states"}
+
+BATCH = 100_000
+START = datetime(2024, 1, 1)
+MESSAGE_TYPES = ["text"] * 8 + ["photo", "voice"]
+
+
+class Dataset:
+    """Sizes of the synthetic history; rows are derived from their index, so nothing is kept in memory."""
+    
+    def __init__(self, users: int, sessions: int, messages: int, active: int):
+        self.users = users
+        self.sessions = sessions
+        self.messages = messages
+        self.active = active
+        self.counselors = max(10, users // 1000)
+        self.categories = list(config.ISSUE_CATEGORIES)
+    
+    def session_user(self, session_id: int) -> int:
+        # Active sessions (the last `active` ones) belong to distinct users
+        return (session_id * 7919) % self.users + 1
+    
+    def session_counselor(self, session_id: int) -> int:
+        return 1_000_000 + session_id % self.counselors
+    
+    def session_created(self, session_id: int) -> datetime:
+        return START + timedelta(seconds=session_id * 30)
+    
+    def session_of_message(self, index: int) -> int:
+        return index * self.sessions // self.messages + 1
+
+
+def _batches(rows: Iterator[Tuple], size: int = BATCH) -> Iterator[List[Tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(path: str, data: Dataset):
+    """Create the schema and fill it with the synthetic history."""
+    conn = Database(path).get_connection()  # applies the migrations
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    rng = random.Random(1)
+    
+    def load(table: str, sql: str, rows: Iterator[Tuple], total: int):
+        started = time.perf_counter()
+        done = 0
+        for batch in _batches(rows):
+            with conn:
+                conn.executemany(sql, batch)
+            done += len(batch)
+            print(f"\r  {table}: {done:,}/{total:,}", end="", flush=True)
+        print(f"\r  {table}: {total:,} rows in {time.perf_counter() - started:.1f} s")
+    
+    print(f"Generating {path}")
+    load("users", "INSERT INTO users (telegram_id, anonymous_id, created_at) VALUES (?, ?, ?)",
+         ((i, f"User-{i:07d}", START.isoformat(" ")) for i in range(1, data.users + 1)), data.users)
+    counselor_ids = [1_000_000 + i for i in range(data.counselors)]
+    load("counselors", "INSERT INTO counselors (telegram_id, categories) VALUES (?, ?)",
+         ((cid, ",".join(data.categories)) for cid in counselor_ids), data.counselors)
+    counselor_categories = [
+        (category, cid) for cid in counselor_ids for category in rng.sample(data.categories, 3)
+    ]
+    load("counselor_categories", "INSERT INTO counselor_categories (category, counselor_id) VALUES (?, ?)",
+         iter(counselor_categories), len(counselor_categories))
+    
+    def sessions() -> Iterator[Tuple]:
+        first_active = data.sessions - data.active + 1
+        for sid in range(1, data.sessions + 1):
+            created = data.session_created(sid)
+            active = sid >= first_active
+            yield (
+                sid, data.session_user(sid), data.session_counselor(sid), data.categories[sid % len(data.categories)],
+                "active" if active else "finished", created.isoformat(" "),
+                None if active else (created + timedelta(minutes=20)).isoformat(" "),
+            )
+    
+    load("chat_sessions",
+         """INSERT INTO chat_sessions
+            (session_id, user_telegram_id, counselor_telegram_id, category, status, created_at, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+         sessions(), data.sessions)
+    
+    def messages() -> Iterator[Tuple]:
+        for index in range(data.messages):
+            sid = data.session_of_message(index)
+            sender = data.session_user(sid) if index % 2 == 0 else data.session_counselor(sid)
+            message_type = MESSAGE_TYPES[index % len(MESSAGE_TYPES)]
+            content = f"message {index}" if message_type == "text" else None
+            file_id = None if message_type == "text" else f"file-{index}"
+            sent_at = data.session_created(sid) + timedelta(seconds=index % 600)
+            yield sid, sender, message_type, content, file_id, sent_at.isoformat(" ")
+    
+    load("messages",
+         """INSERT INTO messages (session_id, sender_telegram_id, message_type, content, file_id, sent_at)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+         messages(), data.messages)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def benchmarks(db: Database, data: Dataset, rng: random.Random) -> Dict[str, Callable[[], Any]]:
+    """Hot Database methods, each called with random realistic arguments."""
+    first_active = data.sessions - data.active + 1
+    
+    def any_session() -> int:
+        return rng.randint(1, data.sessions)
+    
+    def any_counselor() -> int:
+        return 1_000_000 + rng.randrange(data.counselors)
+    
+    return {
+        "get_active_session": lambda: db.get_active_session(data.session_user(rng.randint(first_active, data.sessions))),
+        "get_counselor_sessions": lambda: db.get_counselor_sessions(any_counselor()),
+        "get_session_messages": lambda: db.get_session_messages(any_session()),
+        "get_counselors_by_category": lambda: db.get_counselors_by_category(rng.choice(data.categories)),
+        "save_message": lambda: db.save_message(rng.randint(first_active, data.sessions), 1, "text", "benchmark"),
+        "get_session_by_id": lambda: db.get_session_by_id(any_session()),
+        "get_user_profile": lambda: db.get_user_profile(rng.randint(1, data.users)),
+        "get_relay_session": lambda: db.get_relay_session(any_counselor(), rng.randint(1, 1000)),
+        "get_counselor_loads": db.get_counselor_loads,
+        "get_all_active_sessions": db.get_all_active_sessions,
+    }
+
+
+def full_scans(db: Database, statements: List[str]) -> List[Tuple[str, str]]:
+    """(statement, plan line) for each full scan of a large table."""
+    conn = db.get_connection()
+    found = []
+    for sql in dict.fromkeys(statements):
+        if not re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT|WITH)", sql, re.IGNORECASE):
+            continue  # BEGIN, COMMIT, PRAGMA
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+            detail = row[-1]
+            match = re.match(r"SCAN (\w+)", detail)
+            if match and match.group(1) in LARGE_TABLES:
+                found.append((sql, detail))
+    return found
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=20_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply all sizes (e.g. 0.01 for a quick run)")
+    parser.add_argument("--db", help="dataset file (default: one per size in the temp directory, reused)")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the dataset even if the file exists")
+    parser.add_argument("--iterations", type=int, default=1000, help="calls per method (default 1000)")
+    parser.add_argument("--plans-only", action="store_true", help="only check query plans")
+    args = parser.parse_args()
+    
+    users = max(100, int(args.users * args.scale))
+    data = Dataset(
+        users=users,
+        sessions=max(100, int(args.sessions * args.scale)),
+        messages=max(100, int(args.messages * args.scale)),
+        active=max(10, users // 20),
+    )
+    path = args.db or os.path.join(
+        tempfile.gettempdir(), f"bot-bench-{data.users}u-{data.sessions}s-{data.messages}m.db"
+    )
+    if args.regenerate and os.path.exists(path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    if not os.path.exists(path):
+        generate(path, data)
+    
+    db = Database(path)
+    rng = random.Random(2)
+    methods = benchmarks(db, data, rng)
+    
+    failures = []
+    if not args.plans_only:
+        print(f"\n{'method':<28}{'ops/s':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for name, call in methods.items():
+        with query_log.track_queries(name) as account:
+            call()
+        scans = full_scans(db, account.statements)
+        failures += [(name, sql, detail) for sql, detail in scans]
+        
+        if args.plans_only:
+            continue
+        iterations = args.iterations if name != "get_all_active_sessions" else max(1, args.iterations // 100)
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - started)
+        mean = sum(samples) / len(samples)
+        print(f"{name:<28}{1 / mean:>10.0f}{mean * 1000:>10.3f}{percentile(samples, 50) * 1000:>10.3f}"
+              f"{percentile(samples, 95) * 1000:>10.3f}{percentile(samples, 99) * 1000:>10.3f}"
+              f"{'  FULL SCAN' if scans else ''}")
+    
+    close_all_connections()
+    if failures:
+        print("\nFull table scans in hot queries:")
+        for name, sql, detail in failures:
+            print(f"  {name}: {detail}\n    {' '.join(sql.split())}")
+        sys.exit(1)
+    print("\nQuery plans OK: no full scans of large tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the Telegram Bot API, for benchmarks.
+Serves getUpdates from an in-memory queue (or pushes updates to a registered
+webhook) and answers send* / copyMessage with fake messages, so the bot can be
+driven offline. Benchmarks wait for the bot's output with expect().
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import ClientSession, web
+
+
+class _Waiter:
+    def __init__(self, chat_id: Optional[int], token: Optional[str]):
+        self.chat_id = chat_id
+        self.token = token
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+    
+    def matches(self, chat_id: int, text: str) -> bool:
+        if self.chat_id is not None and self.chat_id != chat_id:
+            return False
+        return self.token is None or self.token in text
+
+
+class FakeBotAPI:
+    """Bot API server on localhost; point the bot's session at `url`."""
+    
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.url = ""
+        self.requests: Dict[str, int] = {}
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_set = asyncio.Event()
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._has_updates = asyncio.Event()
+        self._update_id = 0
+        self._message_ids: Dict[int, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._client: Optional[ClientSession] = None
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Start serving (on a free port by default)."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+    
+    async def stop(self):
+        if self._client is not None:
+            await self._client.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+    
+    # Updates
+    
+    def next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+    
+    async def push(self, update: Dict[str, Any]):
+        """Deliver an update: to the webhook if one is set, else to getUpdates."""
+        if self.webhook_url is None:
+            self._updates.append(update)
+            self._has_updates.set()
+            return
+        if self._client is None:
+            self._client = ClientSession()
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret or ""}
+        async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Webhook answered {response.status}")
+    
+    async def wait_for_webhook(self, timeout: float = 10):
+        await asyncio.wait_for(self._webhook_set.wait(), timeout)
+    
+    def expect(self, chat_id: Optional[int] = None, token: Optional[str] = None) -> asyncio.Future:
+        """
+        Future resolved with (arrival time, message) by the next message the bot
+        sends to chat_id (any chat if None) whose text or caption contains token.
+        Register it before pushing the update that causes the message.
+        """
+        waiter = _Waiter(chat_id, token)
+        self._waiters.append(waiter)
+        return waiter.future
+    
+    # Bot API methods
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] = self.requests.get(method, 0) + 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif method == "setWebhook":
+            self.webhook_url = params["url"]
+            self.webhook_secret = params.get("secret_token")
+            self._webhook_set.set()
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            result = True
+        elif method == "copyMessage":
+            result = {"message_id": self._deliver(params)["message_id"]}
+        elif method == "sendMediaGroup":
+            media = json.loads(params["media"])
+            result = [self._deliver(params, caption=item.get("caption")) for item in media]
+        elif method.startswith("send"):
+            result = self._deliver(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+    
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset", 0))
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit", 100))
+        return [update for _, update in zip(range(limit), self._updates)]
+    
+    def _deliver(self, params: Dict[str, Any], caption: Optional[str] = None) -> Dict[str, Any]:
+        """Record a message sent by the bot and wake whoever waits for it."""
+        chat_id = int(params["chat_id"])
+        message_id = self._message_ids.get(chat_id, 0) + 1
+        self._message_ids[chat_id] = message_id
+        text = params.get("text") or caption or params.get("caption") or ""
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Benchmark"},
+            "text": text,
+        }
+        arrived = time.perf_counter()
+        for waiter in list(self._waiters):
+            if waiter.future.done():  # timed out
+                self._waiters.remove(waiter)
+            elif waiter.matches(chat_id, text):
+                waiter.future.set_result((arrived, message))
+                self._waiters.remove(waiter)
+                break
+        return message
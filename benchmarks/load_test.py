@@ -0,0 +1,251 @@
+"""
+End-to-end load benchmark.
+
+Runs the real bot (main.main(), with its dispatcher, database and delivery
+queue) against a local fake Bot API, and drives it with synthetic users and
+counselors: /start, language, category, a few chat messages each answered by
+the counselor replying to the relayed message, then /end.
+
+Usage:
+    python benchmarks/load_test.py --users 2000 --counselors 100
+    python benchmarks/load_test.py --webhook --api-latency-ms 20
+
+Reports updates/sec and p50/p95/p99 of handler time, of the time from an
+update to the bot's answer, and of relay time in both directions. The bot
+runs in a temporary directory with a fresh database. Telegram's send rate
+limits are lifted unless --telegram-limits is given, so the numbers measure
+the bot rather than the limiter.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+USER_ID_BASE = 2_000_000
+COUNSELOR_ID_BASE = 1_000_000
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _marker(text: str) -> str:
+    """The fixed start of a bot string, to recognize the message once formatted."""
+    return text.split("{")[0].split("\n")[0]
+
+
+class LoadTest:
+    """Synthetic users and counselors talking to the bot through a FakeBotAPI."""
+    
+    def __init__(self, api: FakeBotAPI, messages: int, timeout: float):
+        import config
+        self.api = api
+        self.messages = messages
+        self.timeout = timeout
+        self.categories = [names["en"] for names in config.ISSUE_CATEGORIES.values()]
+        self.language_prompt = "Please select your language"
+        self.welcome = _marker(config.STRINGS["welcome"]["en"])
+        self.connected = _marker(config.STRINGS["connected"]["en"])
+        self.ended = _marker(config.STRINGS["session_ended"]["en"])
+        self.updates = 0
+        self.failures: Dict[str, int] = {}
+        # sample name -> seconds
+        self.samples: Dict[str, List[float]] = {"response": [], "relay_to_counselor": [], "relay_to_user": []}
+        self._message_id = 0
+    
+    def _update(self, user_id: int, text: str, reply_to: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        }
+        if reply_to is not None:
+            message["reply_to_message"] = reply_to
+        return {"update_id": self.api.next_update_id(), "message": message}
+    
+    async def _send(self, sample: str, user_id: int, text: str, wait_chat: Optional[int], wait_token: str,
+                    reply_to: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Send an update and wait for the bot's message it causes; returns that message."""
+        answer = self.api.expect(wait_chat, wait_token)
+        started = time.perf_counter()
+        await self.api.push(self._update(user_id, text, reply_to))
+        self.updates += 1
+        try:
+            arrived, message = await asyncio.wait_for(answer, self.timeout)
+        except asyncio.TimeoutError:
+            self.failures[sample] = self.failures.get(sample, 0) + 1
+            return None
+        self.samples[sample].append(arrived - started)
+        return message
+    
+    async def user_session(self, index: int):
+        """One user's conversation from /start to /end."""
+        user_id = USER_ID_BASE + index
+        steps = [
+            ("/start", self.language_prompt),
+            ("English", self.welcome),
+            (self.categories[index % len(self.categories)], self.connected),
+        ]
+        for text, expected in steps:
+            if await self._send("response", user_id, text, user_id, expected) is None:
+                return
+        for n in range(self.messages):
+            token = f"bench-u{user_id}-{n}"
+            relayed = await self._send("relay_to_counselor", user_id, token, None, token)
+            if relayed is None:
+                return
+            counselor_id = relayed["chat"]["id"]
+            reply = f"bench-c{user_id}-{n}"
+            if await self._send("relay_to_user", counselor_id, reply, user_id, reply, reply_to=relayed) is None:
+                return
+        await self._send("response", user_id, "/end", user_id, self.ended)
+    
+    async def run(self, users: int, concurrency: int) -> float:
+        """Run all user conversations, `concurrency` at a time. Returns the elapsed seconds."""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def limited(index: int):
+            async with semaphore:
+                await self.user_session(index)
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(index) for index in range(users)))
+        return time.perf_counter() - started
+
+
+def report(test: LoadTest, handler_times: List[float], elapsed: float, args: argparse.Namespace) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "mode": "webhook" if args.webhook else "polling",
+        "users": args.users,
+        "counselors": args.counselors,
+        "updates": test.updates,
+        "elapsed_s": round(elapsed, 2),
+        "updates_per_s": round(test.updates / elapsed, 1) if elapsed else 0,
+        "failures": test.failures,
+    }
+    for name, samples in [("handler", handler_times)] + list(test.samples.items()):
+        result[name] = {
+            "count": len(samples),
+            **{f"p{p}_ms": round(percentile(samples, p) * 1000, 2) for p in (50, 95, 99)},
+        }
+    return result
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"{result['updates']} updates from {result['users']} users / {result['counselors']} counselors "
+          f"({result['mode']}) in {result['elapsed_s']} s: {result['updates_per_s']} updates/s")
+    if result["failures"]:
+        print(f"Timed out: {result['failures']}")
+    print(f"{'latency (ms)':<20}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name in ("handler", "response", "relay_to_counselor", "relay_to_user"):
+        row = result[name]
+        print(f"{name:<20}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    api = FakeBotAPI(latency_ms=args.api_latency_ms)
+    await api.start()
+    
+    # Configure the bot before its modules read the environment
+    os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+    os.environ["PORT"] = str(args.port)
+    os.environ["WORKERS"] = "1"
+    if args.webhook:
+        os.environ["WEBHOOK_URL"] = f"http://127.0.0.1:{args.port}"
+    else:
+        os.environ.pop("WEBHOOK_URL", None)
+    if not args.telegram_limits:
+        for name in ("DELIVERY_GLOBAL_RATE", "DELIVERY_CHAT_RATE", "DELIVERY_CHAT_BURST"):
+            os.environ[name] = "1000000"
+    
+    from aiogram.client.telegram import TelegramAPIServer
+    import config
+    import main
+    from database import Database
+    
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.getLogger("slow_updates").setLevel(logging.ERROR)
+    main.bot.session.api = TelegramAPIServer.from_base(api.url)
+    
+    # Counselors take every category
+    db = Database()
+    for index in range(args.counselors):
+        db.add_counselor(COUNSELOR_ID_BASE + index, list(config.ISSUE_CATEGORIES))
+    
+    handler_times: List[float] = []
+    
+    async def time_handler(handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_times.append(time.perf_counter() - started)
+    
+    main.dp.message.middleware(time_handler)
+    
+    bot_task = asyncio.create_task(main.main())
+    try:
+        if args.webhook:
+            await api.wait_for_webhook()
+        test = LoadTest(api, args.messages, args.timeout)
+        elapsed = await test.run(args.users, args.concurrency)
+    finally:
+        if main.dp._running_lock.locked():
+            await main.dp.stop_polling()
+        else:
+            bot_task.cancel()
+        try:
+            await bot_task
+        except asyncio.CancelledError:
+            pass
+        await api.stop()
+    return report(test, handler_times, elapsed, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users (default 1000)")
+    parser.add_argument("--counselors", type=int, default=50, help="synthetic counselors (default 50)")
+    parser.add_argument("--messages", type=int, default=3, help="chat messages per user, each answered (default 3)")
+    parser.add_argument("--concurrency", type=int, default=100, help="users talking at once (default 100)")
+    parser.add_argument("--webhook", action="store_true", help="receive updates by webhook instead of polling")
+    parser.add_argument("--port", type=int, default=8780, help="port of the bot's web server (default 8780)")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="added latency of every Bot API call")
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the configured send rate limits")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each answer (default 30)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log")
+    args = parser.parse_args()
+    
+    # Fresh database and files in a temporary directory
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as directory:
+        os.chdir(directory)
+        result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
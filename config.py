@@ -4,6 +4,7 @@ Contains bot settings, admin ID, and counselor categories.
 """
 
 import os
+import hashlib
 from typing import Dict, List
 
 # Bot token from environment variable
@@ -24,6 +25,33 @@ COUNSELOR_CATEGORIES: Dict[str, List[int]] = {
     "other": []
 }
 
+# Worker processes: above 1, a supervisor routes updates by user ID to this many workers,
+# which share session and assignment state through the database
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Web server (health check, and Telegram updates in webhook mode)
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("PORT", "8080"))
+# With several workers, worker N serves its /metrics on WORKER_METRICS_PORT + N
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", str(WEB_SERVER_PORT + 1)))
+
+# Webhook mode: set WEBHOOK_URL (public https base URL) to receive updates by webhook instead of polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram sends this in X-Telegram-Bot-Api-Secret-Token; defaults to a value derived from the bot token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", hashlib.sha256(BOT_TOKEN.encode()).hexdigest())
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # parallel deliveries from Telegram
+WEBHOOK_MAX_CONCURRENT_UPDATES = int(os.getenv("WEBHOOK_MAX_CONCURRENT_UPDATES", "64"))  # updates processed at once
+
+# Counselor assignment: "least_loaded", "round_robin" or "random"
+ASSIGNMENT_METHOD = os.getenv("ASSIGNMENT_METHOD", "least_loaded")
+
+# Maximum open sessions per counselor (0 = no limit)
+COUNSELOR_MAX_SESSIONS = int(os.getenv("COUNSELOR_MAX_SESSIONS", "0"))
+
+# Supported languages, by code
+LANGUAGES = {"en": "English", "am": "አማርኛ"}
+
 # Issue categories for users
 ISSUE_CATEGORIES = {
     "mental_health": {"en": "Mental Health", "am": "የአእምሮ ጤና"},
@@ -77,6 +105,10 @@ STRINGS = {
         "en": "✅ Your session has been ended.\n\nThank you for using our counseling service.\nIf you want another counseling service, please select an issue below.",
         "am": "✅ ውይይቱ ተጠናቋል።\n\nየእኛን የምክር አገልግሎት ስለተጠቀሙ እናመሰግናለን።\nሌላ የምክር አገልግሎት ከፈለጉ፣ እባክዎ ከታች ያለውን ጉዳይ ይምረጡ።"
     },
+    "session_expired": {
+        "en": "⏰ Your session was closed because there were no messages for a while.\n\nIf you want another counseling service, please select an issue below.",
+        "am": "⏰ ለተወሰነ ጊዜ ምንም መልእክት ስላልነበረ ውይይቱ ተዘግቷል።\n\nሌላ የምክር አገልግሎት ከፈለጉ፣ እባክዎ ከታች ያለውን ጉዳይ ይምረጡ።"
+    },
     "error_generic": {
         "en": "❌ Error: {error}\nPlease try again or contact support.",
         "am": "❌ ስህተት አጋጥሟል: {error}\nእባክዎ እንደገና ይሞክሩ።"
@@ -91,14 +123,61 @@ STRINGS = {
     },
     "buttons": {
         "end": {"en": "End Session", "am": "ጨርስ"},
-        "back": {"en": "Return Back", "am": "ተመለስ"}
+        "back": {"en": "Return Back", "am": "ተመለስ"},
+        "change_language": {"en": "🌐 Change Language", "am": "🌐 ቋንቋ ቀይር"}
     }
 }
 
 # Database file path
 DATABASE_PATH = "counseling_bot.db"
 
+# User profile cache (anonymous ID, blocked flag, counselor role)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))  # profiles kept in memory
+# Other workers' changes are only seen after expiry, so entries live shorter with several workers
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300" if WORKERS == 1 else "5"))  # seconds before a profile is re-read
+
+# Message journal: messages are saved in batches in the background
+MESSAGE_FLUSH_BATCH_SIZE = int(os.getenv("MESSAGE_FLUSH_BATCH_SIZE", "100"))  # flush after this many messages
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "200"))  # or after this long
+MESSAGE_JOURNAL_MAX_PENDING = int(os.getenv("MESSAGE_JOURNAL_MAX_PENDING", "10000"))  # handlers wait when this many are queued
+
+# Albums: parts are collected until none arrives for this long, then sent as one media group
+MEDIA_GROUP_WAIT_MS = int(os.getenv("MEDIA_GROUP_WAIT_MS", "300"))
+
+# Relayed message index: lets counselors answer by replying to a relayed message
+RELAY_INDEX_CACHE_SIZE = int(os.getenv("RELAY_INDEX_CACHE_SIZE", "50000"))  # mappings kept in memory
+
+# FSM storage: delay before writing state changes, so back-to-back updates become one write
+FSM_FLUSH_INTERVAL_MS = int(os.getenv("FSM_FLUSH_INTERVAL_MS", "50"))
+
+# Idle sessions: finished automatically after this long without messages (0 = never)
+SESSION_IDLE_TIMEOUT_MINUTES = int(os.getenv("SESSION_IDLE_TIMEOUT_MINUTES", "1440"))
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))  # how often to look for them
+
+# Log export: gzip-compress the NDJSON file
+EXPORT_COMPRESS = os.getenv("EXPORT_COMPRESS", "1") == "1"
+
+# Outbound delivery limits (Telegram allows about 30 messages/s overall and 1/s per chat)
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "30"))  # messages per second, all chats (shared by all workers)
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))  # messages per second, one chat
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "3"))  # short burst allowed per chat
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "3"))  # retries after TelegramRetryAfter
+
+# Tracing: log a breakdown of updates that take longer than this
+SLOW_UPDATE_THRESHOLD_MS = float(os.getenv("SLOW_UPDATE_THRESHOLD_MS", "1000"))
+
+# Query accounting: count SQL statements per handler and warn about N+1 patterns
+QUERY_ACCOUNTING = os.getenv("QUERY_ACCOUNTING", "0") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))  # repeats of one query shape per handler
+
+# SQLite connection tuning
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))  # prepared statements kept per connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # wait this long for a locked database
+
 # Anonymous ID format
 ANONYMOUS_ID_PREFIX = "User-"
-ANONYMOUS_ID_LENGTH = 4  # e.g., User-2941
+ANONYMOUS_ID_LENGTH = int(os.getenv("ANONYMOUS_ID_LENGTH", "4"))  # e.g., User-2941; longer IDs are used once a length runs out
+ANONYMOUS_ID_BATCH_SIZE = int(os.getenv("ANONYMOUS_ID_BATCH_SIZE", "64"))  # IDs reserved per database round trip
+# Key for shuffling the ID sequence (changing it only affects IDs issued afterwards)
+ANONYMOUS_ID_SECRET = os.getenv("ANONYMOUS_ID_SECRET", BOT_TOKEN)
 
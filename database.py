@@ -4,98 +4,182 @@ Handles all SQLite database operations.
 """
 
 import sqlite3
+import asyncio
 import logging
-from typing import Optional, List, Dict, Tuple
+import threading
+import time
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple, Any, Callable, Iterator
 from datetime import datetime
 import config
+import migrations
+from utils import metrics, query_log, tracing
 
 logger = logging.getLogger(__name__)
 
 
+class ConnectionManager:
+    """
+    Hands out long-lived SQLite connections, one per thread.
+    
+    Opening a connection parses the schema and sets up locking, so connections
+    are kept open for the life of the process instead of per query.
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+    
+    def get(self) -> sqlite3.Connection:
+        """Get the connection owned by the calling thread, opening it if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        # Statement hook for query accounting, switched on and off at runtime
+        if getattr(self._local, "traced", False) != query_log.enabled:
+            conn.set_trace_callback(query_log.record_statement if query_log.enabled else None)
+            self._local.traced = query_log.enabled
+        return conn
+    
+    def _open(self) -> sqlite3.Connection:
+        """Open and tune a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,  # closed from the shutdown hook's thread
+            cached_statements=config.DB_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT_MS)}")
+        return conn
+    
+    def release(self):
+        """Close the calling thread's connection, for threads that don't live as long as the process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self._local.traced = False
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+    
+    def close_all(self):
+        """Close every connection opened by this manager."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error closing database connection: {e}")
+
+
+# One manager per database file, shared by every Database instance
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: str) -> ConnectionManager:
+    """Get the shared connection manager for a database file."""
+    with _managers_lock:
+        manager = _managers.get(db_path)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[db_path] = manager
+        return manager
+
+
+# One worker thread per database file, shared by every AsyncDatabase instance
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def get_executor(db_path: str) -> ThreadPoolExecutor:
+    """Get the dedicated database thread for a database file."""
+    with _managers_lock:
+        executor = _executors.get(db_path)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+            _executors[db_path] = executor
+        return executor
+
+
+# Callbacks run with a telegram_id whenever that user's profile rows change
+_profile_listeners: List[Callable[[int], None]] = []
+
+
+def add_profile_listener(callback: Callable[[int], None]):
+    """Register a callback for user/counselor profile changes (e.g. cache invalidation)."""
+    _profile_listeners.append(callback)
+
+
+def _profile_changed(telegram_id: int):
+    for callback in _profile_listeners:
+        callback(telegram_id)
+
+
+def close_all_connections():
+    """Finish pending database work and close all pooled connections (called on shutdown)."""
+    with _managers_lock:
+        managers = list(_managers.values())
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+    for manager in managers:
+        manager.close_all()
+    logger.info("Database connections closed")
+
+
 class Database:
     """Database handler for storing users, counselors, chats, and sessions."""
     
     def __init__(self, db_path: str = config.DATABASE_PATH):
         """Initialize database connection and create tables if they don't exist."""
         self.db_path = db_path
+        self._connections = get_connection_manager(db_path)
         self.init_database()
     
     def get_connection(self) -> sqlite3.Connection:
-        """Get a database connection."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get the pooled connection for the current thread. Do not close it."""
+        return self._connections.get()
+    
+    def close(self):
+        """Close all pooled connections for this database file."""
+        self._connections.close_all()
+    
+    def release_connection(self):
+        """Close the current thread's pooled connection (e.g. at the end of a one-off worker thread)."""
+        self._connections.release()
     
     def init_database(self):
-        """Create all necessary tables if they don't exist."""
+        """Create or upgrade the schema by applying pending migrations."""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Users table - stores Telegram users with their anonymous IDs
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                telegram_id INTEGER PRIMARY KEY,
-                anonymous_id TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_blocked INTEGER DEFAULT 0
-            )
-        """)
-        
-        # Counselors table - stores counselor information
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS counselors (
-                telegram_id INTEGER PRIMARY KEY,
-                categories TEXT NOT NULL,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Chat sessions table - stores active chat sessions
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chat_sessions (
-                session_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_telegram_id INTEGER NOT NULL,
-                counselor_telegram_id INTEGER NOT NULL,
-                category TEXT NOT NULL,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                finished_at TIMESTAMP,
-                FOREIGN KEY (user_telegram_id) REFERENCES users(telegram_id),
-                FOREIGN KEY (counselor_telegram_id) REFERENCES counselors(telegram_id)
-            )
-        """)
-        
-        # Messages table - stores all messages in chat sessions
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id INTEGER NOT NULL,
-                sender_telegram_id INTEGER NOT NULL,
-                message_type TEXT NOT NULL,
-                content TEXT,
-                file_id TEXT,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (session_id) REFERENCES chat_sessions(session_id)
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully")
+        version = migrations.migrate(conn)
+        logger.info(f"Database initialized successfully (schema version {version})")
     
     # User operations
     def create_user(self, telegram_id: int, anonymous_id: str) -> bool:
         """Create a new user with an anonymous ID."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR IGNORE INTO users (telegram_id, anonymous_id) VALUES (?, ?)",
-                (telegram_id, anonymous_id)
-            )
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR IGNORE INTO users (telegram_id, anonymous_id) VALUES (?, ?)",
+                    (telegram_id, anonymous_id)
+                )
+            _profile_changed(telegram_id)
             return True
         except Exception as e:
             logger.error(f"Error creating user: {e}")
@@ -107,7 +191,6 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT anonymous_id FROM users WHERE telegram_id = ?", (telegram_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
     
     def get_user_telegram_id(self, anonymous_id: str) -> Optional[int]:
@@ -116,17 +199,16 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT telegram_id FROM users WHERE anonymous_id = ?", (anonymous_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
     
     def block_user(self, telegram_id: int) -> bool:
         """Block a user."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET is_blocked = 1 WHERE telegram_id = ?", (telegram_id,))
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE users SET is_blocked = 1 WHERE telegram_id = ?", (telegram_id,))
+            _profile_changed(telegram_id)
             return True
         except Exception as e:
             logger.error(f"Error blocking user: {e}")
@@ -136,37 +218,95 @@ class Database:
         """Unblock a user."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET is_blocked = 0 WHERE telegram_id = ?", (telegram_id,))
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE users SET is_blocked = 0 WHERE telegram_id = ?", (telegram_id,))
+            _profile_changed(telegram_id)
             return True
         except Exception as e:
             logger.error(f"Error unblocking user: {e}")
             return False
     
+    def get_user_profile(self, telegram_id: int) -> Dict:
+        """Get anonymous ID, blocked flag and counselor role for a user in one query."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT (SELECT anonymous_id FROM users WHERE telegram_id = ?1),
+                      (SELECT is_blocked FROM users WHERE telegram_id = ?1),
+                      EXISTS (SELECT 1 FROM counselors WHERE telegram_id = ?1)""",
+            (telegram_id,)
+        )
+        row = cursor.fetchone()
+        return {
+            "telegram_id": telegram_id,
+            "anonymous_id": row[0],
+            "is_blocked": row[1] == 1,
+            "is_counselor": bool(row[2])
+        }
+    
+    def get_user_profiles(self, telegram_ids: List[int]) -> Dict[int, Dict]:
+        """Get profiles for many users at once (see get_user_profile)."""
+        profiles = {
+            telegram_id: {"telegram_id": telegram_id, "anonymous_id": None, "is_blocked": False, "is_counselor": False}
+            for telegram_id in telegram_ids
+        }
+        ids = list(profiles)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT telegram_id, anonymous_id, is_blocked FROM users WHERE telegram_id IN ({placeholders})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                profiles[row[0]]["anonymous_id"] = row[1]
+                profiles[row[0]]["is_blocked"] = row[2] == 1
+            cursor.execute(f"SELECT telegram_id FROM counselors WHERE telegram_id IN ({placeholders})", chunk)
+            for row in cursor.fetchall():
+                profiles[row[0]]["is_counselor"] = True
+        return profiles
+    
     def is_user_blocked(self, telegram_id: int) -> bool:
         """Check if a user is blocked."""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT is_blocked FROM users WHERE telegram_id = ?", (telegram_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] == 1 if result else False
     
+    def reserve_id_block(self, name: str, count: int) -> int:
+        """Reserve `count` consecutive values of a named counter and return the first."""
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR IGNORE INTO id_counters (name, next_value) VALUES (?, 0)", (name,))
+            cursor.execute("SELECT next_value FROM id_counters WHERE name = ?", (name,))
+            start = cursor.fetchone()[0]
+            cursor.execute("UPDATE id_counters SET next_value = next_value + ? WHERE name = ?", (count, name))
+        return start
+    
     # Counselor operations
     def add_counselor(self, telegram_id: int, categories: List[str]) -> bool:
         """Add a counselor with their categories."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            categories_str = ",".join(categories)
-            cursor.execute(
-                "INSERT OR REPLACE INTO counselors (telegram_id, categories) VALUES (?, ?)",
-                (telegram_id, categories_str)
-            )
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                categories_str = ",".join(categories)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO counselors (telegram_id, categories) VALUES (?, ?)",
+                    (telegram_id, categories_str)
+                )
+                cursor.execute("DELETE FROM counselor_categories WHERE counselor_id = ?", (telegram_id,))
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO counselor_categories (counselor_id, category) VALUES (?, ?)",
+                    [(telegram_id, category) for category in categories]
+                )
+            _profile_changed(telegram_id)
             return True
         except Exception as e:
             logger.error(f"Error adding counselor: {e}")
@@ -176,10 +316,11 @@ class Database:
         """Remove a counselor."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM counselors WHERE telegram_id = ?", (telegram_id,))
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM counselor_categories WHERE counselor_id = ?", (telegram_id,))
+                cursor.execute("DELETE FROM counselors WHERE telegram_id = ?", (telegram_id,))
+            _profile_changed(telegram_id)
             return True
         except Exception as e:
             logger.error(f"Error removing counselor: {e}")
@@ -190,11 +331,13 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT telegram_id FROM counselors WHERE is_active = 1 AND categories LIKE ?",
-            (f"%{category}%",)
+            """SELECT c.telegram_id
+               FROM counselor_categories cc
+               JOIN counselors c ON c.telegram_id = cc.counselor_id
+               WHERE cc.category = ? AND c.is_active = 1""",
+            (category,)
         )
         results = cursor.fetchall()
-        conn.close()
         return [row[0] for row in results]
     
     def is_counselor(self, telegram_id: int) -> bool:
@@ -203,20 +346,23 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM counselors WHERE telegram_id = ?", (telegram_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] > 0 if result else False
     
     def get_all_counselors(self) -> List[Dict]:
         """Get all counselors (admin only)."""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT telegram_id, categories, is_active FROM counselors")
+        cursor.execute(
+            """SELECT c.telegram_id, GROUP_CONCAT(cc.category), c.is_active
+               FROM counselors c
+               LEFT JOIN counselor_categories cc ON cc.counselor_id = c.telegram_id
+               GROUP BY c.telegram_id"""
+        )
         results = cursor.fetchall()
-        conn.close()
         return [
             {
                 "telegram_id": row[0],
-                "categories": row[1].split(","),
+                "categories": row[1].split(",") if row[1] else [],
                 "is_active": bool(row[2])
             }
             for row in results
@@ -227,16 +373,15 @@ class Database:
         """Create a new chat session and return session_id."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                """INSERT INTO chat_sessions 
-                   (user_telegram_id, counselor_telegram_id, category, status)
-                   VALUES (?, ?, ?, 'active')""",
-                (user_telegram_id, counselor_telegram_id, category)
-            )
-            session_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """INSERT INTO chat_sessions 
+                       (user_telegram_id, counselor_telegram_id, category, status)
+                       VALUES (?, ?, ?, 'active')""",
+                    (user_telegram_id, counselor_telegram_id, category)
+                )
+                session_id = cursor.lastrowid
             return session_id
         except Exception as e:
             logger.error(f"Error creating chat session: {e}")
@@ -254,7 +399,6 @@ class Database:
             (user_telegram_id,)
         )
         result = cursor.fetchone()
-        conn.close()
         if result:
             return {
                 "session_id": result[0],
@@ -276,7 +420,6 @@ class Database:
             (counselor_telegram_id, status)
         )
         results = cursor.fetchall()
-        conn.close()
         return [
             {
                 "session_id": row[0],
@@ -291,18 +434,58 @@ class Database:
         """Mark a session as finished."""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE chat_sessions SET status = 'finished', finished_at = CURRENT_TIMESTAMP WHERE session_id = ?",
-                (session_id,)
-            )
-            conn.commit()
-            conn.close()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE chat_sessions SET status = 'finished', finished_at = CURRENT_TIMESTAMP WHERE session_id = ?",
+                    (session_id,)
+                )
             return True
         except Exception as e:
             logger.error(f"Error finishing session: {e}")
             return False
     
+    def expire_idle_sessions(self, idle_since: str) -> List[Dict]:
+        """
+        Finish every active session with no message since `idle_since`
+        (a UTC 'YYYY-MM-DD HH:MM:SS' timestamp) with one UPDATE.
+        Returns the finished sessions.
+        """
+        # Range over (status, created_at), then one lookup per candidate in (session_id, sent_at)
+        idle = """status = 'active' AND created_at < :idle_since
+                  AND NOT EXISTS (SELECT 1 FROM messages m
+                                  WHERE m.session_id = chat_sessions.session_id AND m.sent_at >= :idle_since)"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                # Take the write lock first so the rows read are the rows updated
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"""SELECT session_id, user_telegram_id, counselor_telegram_id, category, created_at
+                        FROM chat_sessions WHERE {idle}""",
+                    {"idle_since": idle_since}
+                )
+                results = cursor.fetchall()
+                if results:
+                    cursor.execute(
+                        f"UPDATE chat_sessions SET status = 'finished', finished_at = CURRENT_TIMESTAMP WHERE {idle}",
+                        {"idle_since": idle_since}
+                    )
+            return [
+                {
+                    "session_id": row[0],
+                    "user_telegram_id": row[1],
+                    "counselor_telegram_id": row[2],
+                    "category": row[3],
+                    "created_at": row[4]
+                }
+                for row in results
+            ]
+        except Exception as e:
+            logger.error(f"Error expiring idle sessions: {e}")
+            return []
+    
     def get_session_by_id(self, session_id: int) -> Optional[Dict]:
         """Get session details by session_id."""
         conn = self.get_connection()
@@ -313,7 +496,6 @@ class Database:
             (session_id,)
         )
         result = cursor.fetchone()
-        conn.close()
         if result:
             return {
                 "session_id": result[0],
@@ -333,7 +515,6 @@ class Database:
                FROM chat_sessions WHERE status = 'active' ORDER BY created_at DESC"""
         )
         results = cursor.fetchall()
-        conn.close()
         return [
             {
                 "session_id": row[0],
@@ -345,24 +526,191 @@ class Database:
             for row in results
         ]
     
+    def get_counselor_loads(self) -> Dict[int, int]:
+        """Get the number of active sessions per counselor."""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT counselor_telegram_id, COUNT(*) FROM chat_sessions
+                   WHERE status = 'active' GROUP BY counselor_telegram_id"""
+            )
+            return dict(cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Error getting counselor loads: {e}")
+            return {}
+    
     # Message operations
     def save_message(self, session_id: int, sender_telegram_id: int, message_type: str, content: str = None, file_id: str = None) -> bool:
         """Save a message to the database."""
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """INSERT INTO messages (session_id, sender_telegram_id, message_type, content, file_id)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (session_id, sender_telegram_id, message_type, content, file_id)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving message: {e}")
+            return False
+    
+    def save_messages(self, messages: List[Tuple]) -> bool:
+        """
+        Save many messages in one transaction.
+        Each item is (session_id, sender_telegram_id, message_type, content, file_id, sent_at).
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    """INSERT INTO messages (session_id, sender_telegram_id, message_type, content, file_id, sent_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    messages
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving messages: {e}")
+            return False
+    
+    # Relayed message index operations
+    def save_relay_messages(self, relays: List[Tuple]) -> bool:
+        """Record relayed messages; each item is (chat_id, message_id, session_id)."""
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO relay_messages (chat_id, message_id, session_id) VALUES (?, ?, ?)",
+                    relays
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving relayed messages: {e}")
+            return False
+    
+    def get_relay_session(self, chat_id: int, message_id: int) -> Optional[int]:
+        """Get the session a relayed message belongs to."""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT session_id FROM relay_messages WHERE chat_id = ? AND message_id = ?",
+                (chat_id, message_id)
+            )
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Error getting relayed message: {e}")
+            return None
+    
+    # FSM storage operations
+    def get_fsm_records(self) -> List[Tuple]:
+        """Get all stored FSM records as (bot_id, chat_id, user_id, thread_id, destiny, state, data)."""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute(
-                """INSERT INTO messages (session_id, sender_telegram_id, message_type, content, file_id)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (session_id, sender_telegram_id, message_type, content, file_id)
+                "SELECT bot_id, chat_id, user_id, thread_id, destiny, state, data FROM fsm_states"
             )
-            conn.commit()
-            conn.close()
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting FSM records: {e}")
+            return []
+    
+    def save_fsm_records(self, upserts: List[Tuple], deletes: List[Tuple]) -> bool:
+        """
+        Write FSM changes in one transaction.
+        Upserts are (bot_id, chat_id, user_id, thread_id, destiny, state, data);
+        deletes are (bot_id, chat_id, user_id, thread_id, destiny).
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.cursor()
+                if upserts:
+                    cursor.executemany(
+                        """INSERT OR REPLACE INTO fsm_states (bot_id, chat_id, user_id, thread_id, destiny, state, data)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        upserts
+                    )
+                if deletes:
+                    cursor.executemany(
+                        """DELETE FROM fsm_states
+                           WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?""",
+                        deletes
+                    )
             return True
         except Exception as e:
-            logger.error(f"Error saving message: {e}")
+            logger.error(f"Error saving FSM records: {e}")
             return False
     
+    def get_fsm_languages(self, bot_id: int, user_ids: List[int]) -> Dict[int, str]:
+        """Get the language saved in each user's private-chat FSM data (users without one are left out)."""
+        languages = {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""SELECT user_id, json_extract(data, '$.language') FROM fsm_states
+                    WHERE bot_id = ? AND chat_id IN ({placeholders}) AND user_id = chat_id""",
+                [bot_id] + chunk
+            )
+            for user_id, language in cursor.fetchall():
+                if language:
+                    languages[user_id] = language
+        return languages
+    
+    def iter_session_export(self, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, page_size: int = 200) -> Iterator[sqlite3.Row]:
+        """
+        Stream finished sessions joined with their users and messages, one row per
+        message (a session without messages yields one row with NULL message columns).
+        Sessions come newest finished first, a page at a time, so memory stays bounded.
+        `since`/`until` bound finished_at as 'YYYY-MM-DD[ HH:MM:SS]' strings (until is exclusive).
+        """
+        conn = self.get_connection()
+        remaining = limit
+        last_finished_at = last_session_id = None
+        while remaining is None or remaining > 0:
+            page_limit = page_size if remaining is None else min(page_size, remaining)
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT s.session_id, s.user_telegram_id, u.anonymous_id, s.counselor_telegram_id,
+                          s.category, s.created_at, s.finished_at,
+                          m.sender_telegram_id, m.message_type, m.content, m.file_id, m.sent_at
+                   FROM (SELECT session_id, user_telegram_id, counselor_telegram_id, category,
+                                created_at, finished_at
+                         FROM chat_sessions
+                         WHERE status = 'finished'
+                           AND (?1 IS NULL OR finished_at >= ?1)
+                           AND (?2 IS NULL OR finished_at < ?2)
+                           AND (?3 IS NULL OR (finished_at, session_id) < (?3, ?4))
+                         ORDER BY finished_at DESC, session_id DESC
+                         LIMIT ?5) s
+                   LEFT JOIN users u ON u.telegram_id = s.user_telegram_id
+                   LEFT JOIN messages m ON m.session_id = s.session_id
+                   ORDER BY s.finished_at DESC, s.session_id DESC, m.sent_at, m.message_id""",
+                (since, until, last_finished_at, last_session_id, page_limit)
+            )
+            sessions = 0
+            for row in cursor:
+                if row[0] != last_session_id:
+                    sessions += 1
+                    last_finished_at, last_session_id = row[6], row[0]
+                yield row
+            cursor.close()
+            if sessions < page_limit:
+                break
+            if remaining is not None:
+                remaining -= sessions
+    
     def get_session_messages(self, session_id: int) -> List[Dict]:
         """Get all messages for a session."""
         conn = self.get_connection()
@@ -373,7 +721,6 @@ class Database:
             (session_id,)
         )
         results = cursor.fetchall()
-        conn.close()
         return [
             {
                 "sender_telegram_id": row[0],
@@ -385,3 +732,61 @@ class Database:
             for row in results
         ]
 
+
+def _timed(name: str, func: Callable) -> Callable:
+    """Wrap a Database method to record its execution time."""
+    @functools.wraps(func)
+    def call(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.db_duration.observe(elapsed, method=name)
+            query_log.record_call(name, elapsed)
+    return call
+
+
+class AsyncDatabase:
+    """
+    Awaitable wrapper around Database with the same method names.
+    
+    Every call runs on one dedicated thread per database file, so a slow
+    commit never blocks the event loop and writes are never interleaved.
+    Usage: ``await db.get_active_session(user_id)``.
+    """
+    
+    def __init__(self, db_path: str = config.DATABASE_PATH):
+        """Initialize the underlying database and its worker thread."""
+        self.db_path = db_path
+        self.sync = Database(db_path)
+        self._executor = get_executor(db_path)
+    
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking callable on the database thread."""
+        loop = asyncio.get_running_loop()
+        # Carry context variables (e.g. per-update tracing) into the thread
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+    
+    def __getattr__(self, name: str) -> Any:
+        """Expose each Database method as a coroutine function."""
+        attr = getattr(self.sync, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        
+        timed = _timed(name, attr)
+        
+        @functools.wraps(attr)
+        async def method(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return await self.run(timed, *args, **kwargs)
+            finally:
+                # Includes waiting for the database thread
+                tracing.record("db", name, time.perf_counter() - start)
+        
+        # Cache so the wrapper is only built once per method
+        setattr(self, name, method)
+        return method
@@ -4,8 +4,8 @@ Handles admin panel and administrative functions.
 """
 
 import logging
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import FrozenSet, List, Optional, Tuple
 from aiogram import Router, F
 from aiogram.types import Message, FSInputFile
 from aiogram.filters import Command, StateFilter
@@ -13,13 +13,20 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import os
 
-from database import Database
+from database import AsyncDatabase
+from utils.session_registry import session_registry
+from utils.profile_cache import profile_cache
+from utils.message_journal import message_journal
+from utils.counselor_assignment import assignment_engine
+from utils import log_export
+from utils.i18n import catalog
+from utils.roles import ADMIN
 from keyboards.menus import get_admin_menu_keyboard
 import config
 
 logger = logging.getLogger(__name__)
 router = Router()
-db = Database()
+db = AsyncDatabase()
 
 
 class AdminStates(StatesGroup):
@@ -30,21 +37,16 @@ class AdminStates(StatesGroup):
     assigning_categories = State()
 
 
-def is_admin(user_id: int) -> bool:
-    """Check if user is admin."""
-    return user_id == config.ADMIN_ID
-
-
 @router.message(Command("admin"))
-async def cmd_admin(message: Message, state: FSMContext):
+async def cmd_admin(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle /admin command - show admin panel."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         await message.answer("❌ You are not authorized as an administrator.")
         return
     
     # Get statistics
-    all_sessions = db.get_all_active_sessions()
-    all_counselors = db.get_all_counselors()
+    all_sessions = await session_registry.get_all_active_sessions()
+    all_counselors = await db.get_all_counselors()
     
     stats_text = (
         f"👑 Admin Panel\n\n"
@@ -59,12 +61,12 @@ async def cmd_admin(message: Message, state: FSMContext):
 
 
 @router.message(F.text == "👥 Manage Counselors")
-async def manage_counselors(message: Message):
+async def manage_counselors(message: Message, roles: FrozenSet[str]):
     """Show counselor management options."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
-    counselors = db.get_all_counselors()
+    counselors = await db.get_all_counselors()
     
     if not counselors:
         await message.answer(
@@ -95,9 +97,9 @@ async def manage_counselors(message: Message):
 
 
 @router.message(Command("add_counselor"))
-async def cmd_add_counselor(message: Message):
+async def cmd_add_counselor(message: Message, roles: FrozenSet[str]):
     """Add a new counselor."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
     try:
@@ -124,7 +126,8 @@ async def cmd_add_counselor(message: Message):
             return
         
         # Add counselor
-        if db.add_counselor(counselor_id, categories):
+        if await db.add_counselor(counselor_id, categories):
+            assignment_engine.invalidate_rosters()
             await message.answer(
                 f"✅ Counselor {counselor_id} added successfully.\n"
                 f"Categories: {', '.join(categories)}"
@@ -136,9 +139,9 @@ async def cmd_add_counselor(message: Message):
 
 
 @router.message(Command("remove_counselor"))
-async def cmd_remove_counselor(message: Message):
+async def cmd_remove_counselor(message: Message, roles: FrozenSet[str]):
     """Remove a counselor."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
     try:
@@ -149,7 +152,8 @@ async def cmd_remove_counselor(message: Message):
         
         counselor_id = int(parts[1])
         
-        if db.remove_counselor(counselor_id):
+        if await db.remove_counselor(counselor_id):
+            assignment_engine.invalidate_rosters()
             await message.answer(f"✅ Counselor {counselor_id} removed successfully.")
         else:
             await message.answer("❌ Error removing counselor.")
@@ -158,21 +162,22 @@ async def cmd_remove_counselor(message: Message):
 
 
 @router.message(F.text == "📊 Active Sessions")
-async def show_active_sessions(message: Message):
+async def show_active_sessions(message: Message, roles: FrozenSet[str]):
     """Show all active sessions."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
-    sessions = db.get_all_active_sessions()
+    sessions = await session_registry.get_all_active_sessions()
     
     if not sessions:
         await message.answer("📭 No active sessions.")
         return
     
     sessions_text = "📊 Active Sessions:\n\n"
+    anonymous_ids = await profile_cache.get_anonymous_ids(s["user_telegram_id"] for s in sessions)
     for session in sessions:
-        user_anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-        category = config.ISSUE_CATEGORIES.get(session["category"], session["category"])
+        user_anonymous_id = anonymous_ids[session["user_telegram_id"]]
+        category = catalog.category_name(session["category"])
         sessions_text += (
             f"• Session ID: {session['session_id']}\n"
             f"  User: {user_anonymous_id} (ID: {session['user_telegram_id']})\n"
@@ -185,9 +190,9 @@ async def show_active_sessions(message: Message):
 
 
 @router.message(F.text == "🚫 Block User")
-async def start_block_user(message: Message, state: FSMContext):
+async def start_block_user(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Start blocking a user."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
     await message.answer(
@@ -199,16 +204,16 @@ async def start_block_user(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(AdminStates.blocking_user))
-async def handle_block_user(message: Message, state: FSMContext):
+async def handle_block_user(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle blocking a user."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         await state.clear()
         return
     
     try:
         user_id = int(message.text)
         
-        if db.block_user(user_id):
+        if await db.block_user(user_id):
             await message.answer(f"✅ User {user_id} has been blocked.")
         else:
             await message.answer("❌ Error blocking user.")
@@ -219,9 +224,9 @@ async def handle_block_user(message: Message, state: FSMContext):
 
 
 @router.message(Command("unblock_user"))
-async def cmd_unblock_user(message: Message):
+async def cmd_unblock_user(message: Message, roles: FrozenSet[str]):
     """Unblock a user."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
     try:
@@ -232,7 +237,7 @@ async def cmd_unblock_user(message: Message):
         
         user_id = int(parts[1])
         
-        if db.unblock_user(user_id):
+        if await db.unblock_user(user_id):
             await message.answer(f"✅ User {user_id} has been unblocked.")
         else:
             await message.answer("❌ Error unblocking user.")
@@ -241,9 +246,9 @@ async def cmd_unblock_user(message: Message):
 
 
 @router.message(Command("force_end"))
-async def cmd_force_end(message: Message):
+async def cmd_force_end(message: Message, roles: FrozenSet[str]):
     """Force end a session (admin only)."""
-    if not is_admin(message.from_user.id):
+    if ADMIN not in roles:
         return
     
     try:
@@ -253,14 +258,14 @@ async def cmd_force_end(message: Message):
             return
         
         user_id = int(parts[1])
-        active_session = db.get_active_session(user_id)
+        active_session = await session_registry.get_active_session(user_id)
         
         if not active_session:
             await message.answer(f"❌ User {user_id} doesn't have an active session.")
             return
         
         # Force end the session
-        result = db.finish_session(active_session["session_id"])
+        result = await session_registry.finish_session(active_session["session_id"])
         if result:
             await message.answer(f"✅ Session {active_session['session_id']} has been force-ended for user {user_id}.")
         else:
@@ -272,91 +277,65 @@ async def cmd_force_end(message: Message):
         await message.answer(f"❌ Error: {str(e)}")
 
 
+def parse_export_args(args: List[str]) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """
+    Parse /export_logs arguments: up to two dates (YYYY-MM-DD, from and to,
+    both inclusive) and a session count, in any order. Raises ValueError.
+    """
+    dates = []
+    limit = None
+    for arg in args:
+        if arg.isdigit():
+            limit = int(arg)
+        else:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d"))
+    if len(dates) > 2:
+        raise ValueError("too many dates")
+    if len(dates) == 2 and dates[0] > dates[1]:
+        raise ValueError("from date is after to date")
+    since = dates[0].strftime("%Y-%m-%d") if dates else None
+    # The end date is inclusive, so stop before the next day
+    until = (dates[1] + timedelta(days=1)).strftime("%Y-%m-%d") if len(dates) == 2 else None
+    return since, until, limit
+
+
 @router.message(F.text == "📥 Export Logs")
-async def export_logs(message: Message):
-    """Export chat logs."""
-    if not is_admin(message.from_user.id):
+@router.message(Command("export_logs"))
+async def export_logs(message: Message, roles: FrozenSet[str]):
+    """Export chat logs as a gzip-compressed NDJSON file."""
+    if ADMIN not in roles:
         return
     
+    # The menu button exports the latest 100 sessions
+    since, until, limit = None, None, 100
+    if message.text.startswith("/"):
+        try:
+            since, until, limit = parse_export_args(message.text.split()[1:])
+        except ValueError:
+            await message.answer(
+                "❌ Usage: /export_logs [from YYYY-MM-DD] [to YYYY-MM-DD] [session count]\n"
+                "Example: /export_logs 2024-01-01 2024-03-31 500"
+            )
+            return
+    
     try:
-        # Get all finished sessions
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT session_id, user_telegram_id, counselor_telegram_id, category, 
-                      created_at, finished_at
-               FROM chat_sessions 
-               WHERE status = 'finished'
-               ORDER BY finished_at DESC
-               LIMIT 100"""
-        )
-        sessions = cursor.fetchall()
+        # Make sure queued messages are in the database
+        await message_journal.flush()
         
-        logs = []
-        for session in sessions:
-            session_id = session[0]
-            user_anonymous_id = db.get_user_anonymous_id(session[1])
+        path, total = await log_export.export_logs(since=since, until=until, limit=limit)
+        try:
+            if total == 0:
+                await message.answer("📭 No finished sessions to export.")
+                return
             
-            # Get messages for this session
-            messages = db.get_session_messages(session_id)
-            
-            session_log = {
-                "session_id": session_id,
-                "user_anonymous_id": user_anonymous_id,
-                "user_telegram_id": session[1],  # Admin can see real IDs
-                "counselor_telegram_id": session[2],
-                "category": session[3],
-                "created_at": session[4],
-                "finished_at": session[5],
-                "messages": [
-                    {
-                        "sender_telegram_id": msg["sender_telegram_id"],
-                        "message_type": msg["message_type"],
-                        "content": msg["content"],
-                        "file_id": msg["file_id"],
-                        "sent_at": msg["sent_at"]
-                    }
-                    for msg in messages
-                ]
-            }
-            logs.append(session_log)
-        
-        conn.close()
-        
-        # Create JSON export
-        export_data = {
-            "export_date": datetime.now().isoformat(),
-            "total_sessions": len(logs),
-            "sessions": logs
-        }
-        
-        export_text = json.dumps(export_data, indent=2, ensure_ascii=False)
-        
-        # Send as document if too long, otherwise as text
-        if len(export_text) > 4000:
-            # Save to file and send
-            filename = f"logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(export_text)
-            
-            try:
-                document = FSInputFile(filename)
-                await message.answer_document(
-                    document=document,
-                    caption=f"📥 Chat logs export\n{len(logs)} sessions"
-                )
-            finally:
-                # Clean up file
-                if os.path.exists(filename):
-                    os.remove(filename)
-        else:
-            await message.answer(
-                f"📥 Chat Logs Export\n\n"
-                f"Total Sessions: {len(logs)}\n\n"
-                f"<code>{export_text}</code>",
-                parse_mode="HTML"
+            await message.answer_document(
+                document=FSInputFile(path),
+                caption=f"📥 Chat logs export\n{total} sessions"
             )
+        finally:
+            # Clean up file
+            if os.path.exists(path):
+                os.remove(path)
     except Exception as e:
         logger.error(f"Error exporting logs: {e}")
         await message.answer("❌ Error exporting logs.")
-
@@ -4,19 +4,27 @@ Handles counselor panel and interactions.
 """
 
 import logging
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Union
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
+from aiogram.methods import SendMessage
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import Database
+from database import AsyncDatabase
+from utils.session_registry import session_registry
+from utils.profile_cache import profile_cache
+from utils.delivery import delivery, PRIORITY_CONTROL
+from utils.relay_index import relay_index
+from utils.relay import relay_message
+from utils.i18n import catalog
+from utils.roles import COUNSELOR, HasRole
 from keyboards.menus import get_counselor_menu_keyboard, get_session_keyboard
-import config
 
 logger = logging.getLogger(__name__)
 router = Router()
-db = Database()
+db = AsyncDatabase()
 
 
 class CounselorStates(StatesGroup):
@@ -26,16 +34,16 @@ class CounselorStates(StatesGroup):
 
 
 @router.message(Command("counselor"))
-async def cmd_counselor(message: Message, state: FSMContext):
+async def cmd_counselor(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle /counselor command - show counselor panel."""
     counselor_id = message.from_user.id
     
-    if not db.is_counselor(counselor_id):
+    if COUNSELOR not in roles:
         await message.answer("❌ You are not authorized as a counselor.")
         return
     
     # Get active sessions
-    active_sessions = db.get_counselor_sessions(counselor_id, status="active")
+    active_sessions = await session_registry.get_counselor_sessions(counselor_id)
     
     if not active_sessions:
         await message.answer(
@@ -46,9 +54,10 @@ async def cmd_counselor(message: Message, state: FSMContext):
         )
     else:
         sessions_text = "📋 Your Active Sessions:\n\n"
+        anonymous_ids = await profile_cache.get_anonymous_ids(s["user_telegram_id"] for s in active_sessions)
         for session in active_sessions:
-            anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-            category = config.ISSUE_CATEGORIES.get(session["category"], session["category"])
+            anonymous_id = anonymous_ids[session["user_telegram_id"]]
+            category = catalog.category_name(session["category"])
             sessions_text += (
                 f"• {anonymous_id} - {category}\n"
                 f"  Session ID: {session['session_id']}\n\n"
@@ -63,24 +72,25 @@ async def cmd_counselor(message: Message, state: FSMContext):
 
 
 @router.message(F.text == "📋 My Sessions")
-async def show_sessions(message: Message):
+async def show_sessions(message: Message, roles: FrozenSet[str]):
     """Show all active sessions for the counselor."""
     counselor_id = message.from_user.id
     
-    if not db.is_counselor(counselor_id):
+    if COUNSELOR not in roles:
         await message.answer("❌ You are not authorized as a counselor.")
         return
     
-    active_sessions = db.get_counselor_sessions(counselor_id, status="active")
+    active_sessions = await session_registry.get_counselor_sessions(counselor_id)
     
     if not active_sessions:
         await message.answer("📭 You have no active sessions.")
         return
     
     sessions_text = "📋 Your Active Sessions:\n\n"
+    anonymous_ids = await profile_cache.get_anonymous_ids(s["user_telegram_id"] for s in active_sessions)
     for session in active_sessions:
-        anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-        category = config.ISSUE_CATEGORIES.get(session["category"], session["category"])
+        anonymous_id = anonymous_ids[session["user_telegram_id"]]
+        category = catalog.category_name(session["category"])
         sessions_text += (
             f"• {anonymous_id} - {category}\n"
             f"  Session ID: {session['session_id']}\n"
@@ -91,15 +101,15 @@ async def show_sessions(message: Message):
 
 
 @router.message(F.text == "💬 Reply to User")
-async def start_reply(message: Message, state: FSMContext):
+async def start_reply(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Start replying to a user."""
     counselor_id = message.from_user.id
     
-    if not db.is_counselor(counselor_id):
+    if COUNSELOR not in roles:
         await message.answer("❌ You are not authorized as a counselor.")
         return
     
-    active_sessions = db.get_counselor_sessions(counselor_id, status="active")
+    active_sessions = await session_registry.get_counselor_sessions(counselor_id)
     
     if not active_sessions:
         await message.answer("❌ You have no active sessions to reply to.")
@@ -107,9 +117,10 @@ async def start_reply(message: Message, state: FSMContext):
     
     # Show sessions to choose from
     sessions_text = "Select a session to reply to:\n\n"
+    anonymous_ids = await profile_cache.get_anonymous_ids(s["user_telegram_id"] for s in active_sessions)
     for idx, session in enumerate(active_sessions, 1):
-        anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-        category = config.ISSUE_CATEGORIES.get(session["category"], session["category"])
+        anonymous_id = anonymous_ids[session["user_telegram_id"]]
+        category = catalog.category_name(session["category"])
         sessions_text += f"{idx}. {anonymous_id} - {category} (ID: {session['session_id']})\n"
     
     await message.answer(
@@ -118,6 +129,30 @@ async def start_reply(message: Message, state: FSMContext):
     await state.set_state(CounselorStates.selecting_session)
 
 
+async def replied_session(message: Message, roles: FrozenSet[str]) -> Union[bool, Dict[str, Any]]:
+    """Filter: a counselor's reply to a message relayed from one of their sessions; passes `session`."""
+    reply = message.reply_to_message
+    if reply is None or COUNSELOR not in roles:
+        return False
+    session_id = await relay_index.lookup(message.chat.id, reply.message_id)
+    if session_id is None:
+        return False
+    session = await session_registry.get_session(session_id)
+    if not session or session["counselor_telegram_id"] != message.from_user.id:
+        return False
+    return {"session": session}
+
+
+@router.message(replied_session)
+async def handle_reply_to_relayed(message: Message, session: Dict[str, Any]):
+    """Route a counselor's reply to a relayed message straight to that session's user."""
+    if session["status"] != "active":
+        await message.answer("❌ This session is not active.")
+        return
+    
+    await relay_to_user(message, session["session_id"], session["user_telegram_id"])
+
+
 @router.message(StateFilter(CounselorStates.selecting_session))
 async def handle_session_selection(message: Message, state: FSMContext):
     """Handle session selection for replying."""
@@ -129,7 +164,7 @@ async def handle_session_selection(message: Message, state: FSMContext):
         await message.answer("❌ Invalid session ID. Please send a number.")
         return
     
-    session = db.get_session_by_id(session_id)
+    session = await session_registry.get_session(session_id)
     
     if not session or session["counselor_telegram_id"] != counselor_id:
         await message.answer("❌ Session not found or you don't have access to it.")
@@ -141,7 +176,7 @@ async def handle_session_selection(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
+    anonymous_id = await profile_cache.get_anonymous_id(session["user_telegram_id"])
     await state.update_data(session_id=session_id, user_id=session["user_telegram_id"])
     
     await message.answer(
@@ -164,82 +199,47 @@ async def handle_counselor_reply(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    session = db.get_session_by_id(session_id)
+    session = await session_registry.get_session(session_id)
     if not session or session["counselor_telegram_id"] != counselor_id:
         await message.answer("❌ Session not found.")
         await state.clear()
         return
     
-    anonymous_id = db.get_user_anonymous_id(user_id)
-    
-    # Save message to database
-    message_type = "text"
-    content = message.text
-    file_id = None
-    
-    if message.photo:
-        message_type = "photo"
-        content = message.caption or ""
-        file_id = message.photo[-1].file_id
-    elif message.voice:
-        message_type = "voice"
-        content = ""
-        file_id = message.voice.file_id
-    elif message.video:
-        message_type = "video"
-        content = message.caption or ""
-        file_id = message.video.file_id
-    elif message.document:
-        message_type = "document"
-        content = message.caption or ""
-        file_id = message.document.file_id
-    
-    db.save_message(session_id, counselor_id, message_type, content, file_id)
-    
-    # Forward message to user
-    try:
-        from bot_instance import get_bot
-        bot = get_bot()
-        
-        if message_type == "text":
-            await bot.send_message(
-                user_id,
-                f"💬 Message from your counselor:\n\n{content}"
-            )
-        elif message_type == "photo":
-            await bot.send_photo(
-                user_id,
-                file_id,
-                caption=f"📷 Photo from your counselor" + (f":\n{content}" if content else "")
-            )
-        elif message_type == "voice":
-            await bot.send_voice(
-                user_id,
-                file_id,
-                caption=f"🎤 Voice message from your counselor"
-            )
-        elif message_type == "video":
-            await bot.send_video(
-                user_id,
-                file_id,
-                caption=f"🎥 Video from your counselor" + (f":\n{content}" if content else "")
-            )
-        elif message_type == "document":
-            await bot.send_document(
-                user_id,
-                file_id,
-                caption=f"📄 Document from your counselor" + (f":\n{content}" if content else "")
-            )
-        
-        await message.answer(f"✅ Message sent to {anonymous_id}")
-    except Exception as e:
+    async def finish(sent: bool):
+        if sent:
+            anonymous_id = await profile_cache.get_anonymous_id(user_id)
+            await message.answer(f"✅ Message sent to {anonymous_id}")
+        await state.clear()
+    
+    # Runs once delivered; for an album only after its window closes, so the
+    # remaining parts still arrive in this state and join the same album
+    await relay_to_user(message, session_id, user_id, on_done=finish)
+
+
+async def relay_to_user(message: Message, session_id: int, user_id: int,
+                        on_done: Optional[Callable[[bool], Awaitable[None]]] = None):
+    """
+    Save a counselor's message and send it to the user. Reports failures to the
+    counselor; on_done(sent) is awaited after delivery or failure.
+    """
+    async def report_failure(e: Exception):
         logger.error(f"Error sending message to user: {e}")
         error_msg = f"❌ Error sending message: {str(e)}\n\n"
         if "chat not found" in str(e).lower() or "blocked" in str(e).lower():
             error_msg += "⚠️ The user hasn't started the bot yet or has blocked it."
         await message.answer(error_msg)
+        if on_done is not None:
+            await on_done(False)
     
-    await state.clear()
+    async def report_sent():
+        if on_done is not None:
+            await on_done(True)
+    
+    try:
+        await relay_message(message, session_id, user_id, "your counselor",
+                            on_error=report_failure, on_sent=report_sent)
+    except Exception as e:
+        await report_failure(e)
 
 
 @router.message(Command("cancel"))
@@ -250,15 +250,15 @@ async def cmd_cancel(message: Message, state: FSMContext):
 
 
 @router.message(F.text == "✅ Finish Session")
-async def finish_session(message: Message):
+async def finish_session(message: Message, roles: FrozenSet[str]):
     """Finish a session."""
     counselor_id = message.from_user.id
     
-    if not db.is_counselor(counselor_id):
+    if COUNSELOR not in roles:
         await message.answer("❌ You are not authorized as a counselor.")
         return
     
-    active_sessions = db.get_counselor_sessions(counselor_id, status="active")
+    active_sessions = await session_registry.get_counselor_sessions(counselor_id)
     
     if not active_sessions:
         await message.answer("❌ You have no active sessions.")
@@ -266,9 +266,10 @@ async def finish_session(message: Message):
     
     # Show sessions to choose from
     sessions_text = "Select a session to finish:\n\n"
+    anonymous_ids = await profile_cache.get_anonymous_ids(s["user_telegram_id"] for s in active_sessions)
     for idx, session in enumerate(active_sessions, 1):
-        anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-        category = config.ISSUE_CATEGORIES.get(session["category"], session["category"])
+        anonymous_id = anonymous_ids[session["user_telegram_id"]]
+        category = catalog.category_name(session["category"])
         sessions_text += f"{idx}. {anonymous_id} - {category} (ID: {session['session_id']})\n"
     
     await message.answer(
@@ -276,7 +277,7 @@ async def finish_session(message: Message):
     )
 
 
-@router.message(lambda m: m.text and m.text.isdigit() and db.is_counselor(m.from_user.id))
+@router.message(F.text.isdigit(), HasRole(COUNSELOR))
 async def handle_finish_session_id(message: Message):
     """Handle finishing a session by ID."""
     counselor_id = message.from_user.id
@@ -286,7 +287,7 @@ async def handle_finish_session_id(message: Message):
     except ValueError:
         return  # Not a session ID, ignore
     
-    session = db.get_session_by_id(session_id)
+    session = await session_registry.get_session(session_id)
     
     if not session or session["counselor_telegram_id"] != counselor_id:
         return  # Not a valid session for this counselor
@@ -296,18 +297,18 @@ async def handle_finish_session_id(message: Message):
         return
     
     # Finish session
-    db.finish_session(session_id)
+    await session_registry.finish_session(session_id)
     
     # Notify user
     try:
-        from bot_instance import get_bot
-        bot = get_bot()
-        anonymous_id = db.get_user_anonymous_id(session["user_telegram_id"])
-        await bot.send_message(
-            session["user_telegram_id"],
-            f"ℹ️ Your counseling session has been finished by the counselor.\n\n"
-            f"Thank you for using our service. Type /start to begin a new session."
-        )
+        anonymous_id = await profile_cache.get_anonymous_id(session["user_telegram_id"])
+        await delivery.send(SendMessage(
+            chat_id=session["user_telegram_id"],
+            text=(
+                f"ℹ️ Your counseling session has been finished by the counselor.\n\n"
+                f"Thank you for using our service. Type /start to begin a new session."
+            )
+        ), priority=PRIORITY_CONTROL)
     except Exception as e:
         logger.error(f"Error notifying user: {e}")
     
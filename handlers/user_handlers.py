@@ -13,21 +13,30 @@ Handles user interactions, issue selection, and messaging.
 """
 
 import logging
+from typing import FrozenSet
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import SendMessage
 from aiogram.fsm.state import State, StatesGroup
 
-from database import Database
+from database import AsyncDatabase
+from utils.session_registry import session_registry
+from utils.profile_cache import profile_cache
+from utils.delivery import delivery, PRIORITY_CONTROL
+from utils.relay_index import relay_index
+from utils.relay import relay_message
 from utils.anonymous import get_or_create_anonymous_id
 from utils.counselor_assignment import assign_counselor
+from utils.i18n import catalog, LANGUAGE, CATEGORY, END, BACK, CHANGE_LANGUAGE
+from utils.roles import BLOCKED
 from keyboards.menus import get_main_menu_keyboard, get_category_keyboard, get_chat_keyboard, get_language_keyboard
 import config
 
 logger = logging.getLogger(__name__)
 router = Router()
-db = Database()
+db = AsyncDatabase()
 
 
 class UserStates(StatesGroup):
@@ -52,42 +61,38 @@ class UserStates(StatesGroup):
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle /start command - show language selection."""
     user_id = message.from_user.id
     
     # Check if user is blocked
-    if db.is_user_blocked(user_id):
+    if BLOCKED in roles:
         # Default to English for blocked message if unknown
         await message.answer(config.STRINGS["blocked"]["en"])
         return
     
     # Get or create anonymous ID (needed for welcome message after language selection)
-    get_or_create_anonymous_id(user_id)
+    await get_or_create_anonymous_id(user_id)
     
-    # Ask for language
+    # Ask for language (state first, so a quick answer is handled in it)
+    await state.set_state(UserStates.waiting_for_language)
     await message.answer(
         "Please select your language / እባክዎ ቋንቋ ይምረጡ:",
         reply_markup=get_language_keyboard()
     )
-    await state.set_state(UserStates.waiting_for_language)
 
 
 @router.message(StateFilter(UserStates.waiting_for_language))
 async def handle_language_selection(message: Message, state: FSMContext):
     """Handle language selection."""
-    selection = message.text
+    button = catalog.button(message.text)
     user_id = message.from_user.id
-    anonymous_id = get_or_create_anonymous_id(user_id)
+    anonymous_id = await get_or_create_anonymous_id(user_id)
     
-    lang = "en"
-    if selection == "አማርኛ":
-        lang = "am"
-    elif selection == "English":
-        lang = "en"
-    else:
+    if button is None or button.action != LANGUAGE:
         await message.answer("Please select from the menu / እባክዎ ከዝርዝሩ ውስጥ ይምረጡ")
         return
+    lang = button.key
     
     # Save language to state
     await state.update_data(language=lang)
@@ -95,8 +100,8 @@ async def handle_language_selection(message: Message, state: FSMContext):
     # Show welcome message
     welcome_text = config.STRINGS["welcome"][lang].format(anonymous_id=anonymous_id)
     
-    await message.answer(welcome_text, reply_markup=get_main_menu_keyboard(lang), parse_mode="HTML")
     await state.set_state(UserStates.waiting_for_issue)
+    await message.answer(welcome_text, reply_markup=get_main_menu_keyboard(lang), parse_mode="HTML")
 
 
 @router.message(Command("end"))
@@ -113,7 +118,7 @@ async def cmd_end(message: Message, state: FSMContext):
         await state.clear()
         await state.update_data(language=lang)
         
-        active_session = db.get_active_session(user_id)
+        active_session = await session_registry.get_active_session(user_id)
         
         if not active_session:
             await message.answer(
@@ -125,7 +130,7 @@ async def cmd_end(message: Message, state: FSMContext):
         
         # Finish session
         session_id = active_session["session_id"]
-        result = db.finish_session(session_id)
+        result = await session_registry.finish_session(session_id)
         
         if not result:
             await message.answer(config.STRINGS["session_ended_error"][lang])
@@ -133,13 +138,11 @@ async def cmd_end(message: Message, state: FSMContext):
         
         # Notify counselor
         try:
-            from bot_instance import get_bot
-            bot = get_bot()
-            anonymous_id = db.get_user_anonymous_id(user_id)
-            await bot.send_message(
-                active_session["counselor_telegram_id"],
-                f"ℹ️ Session with {anonymous_id} has been ended by the user."
-            )
+            anonymous_id = await profile_cache.get_anonymous_id(user_id)
+            await delivery.send(SendMessage(
+                chat_id=active_session["counselor_telegram_id"],
+                text=f"ℹ️ Session with {anonymous_id} has been ended by the user."
+            ), priority=PRIORITY_CONTROL)
         except Exception as e:
             logger.error(f"Error notifying counselor: {e}")
         
@@ -151,7 +154,7 @@ async def cmd_end(message: Message, state: FSMContext):
         
         # Set state to waiting for issue
         await state.set_state(UserStates.waiting_for_issue)
-        
+    
     except Exception as e:
         logger.error(f"Error in cmd_end: {e}", exc_info=True)
         await message.answer(config.STRINGS["error_generic"][lang].format(error=str(e)))
@@ -166,75 +169,67 @@ async def handle_issue_selection(message: Message, state: FSMContext):
     
     user_id = message.from_user.id
     selected_text = message.text
+    button = catalog.button(selected_text)
     
     # Get language
     data = await state.get_data()
     lang = data.get("language", "en")
     
     # Check if user selected a language instead of an issue (e.g. double click or old keyboard)
-    if selected_text in ["English", "አማርኛ"]:
-        new_lang = "en" if selected_text == "English" else "am"
+    if button is not None and button.action == LANGUAGE:
+        new_lang = button.key
         await state.update_data(language=new_lang)
         
         # Show welcome message with new language
-        anonymous_id = get_or_create_anonymous_id(user_id)
+        anonymous_id = await get_or_create_anonymous_id(user_id)
         welcome_text = config.STRINGS["welcome"][new_lang].format(anonymous_id=anonymous_id)
         await message.answer(welcome_text, reply_markup=get_main_menu_keyboard(new_lang), parse_mode="HTML")
         return
     
     # Check if user wants to change language
-    if selected_text in ["🌐 Change Language", "🌐 ቋንቋ ቀይር"]:
+    if button is not None and button.action == CHANGE_LANGUAGE:
+        await state.set_state(UserStates.waiting_for_language)
         await message.answer(
             "Please select your language / እባክዎ ቋንቋ ይምረጡ:",
             reply_markup=get_language_keyboard()
         )
-        await state.set_state(UserStates.waiting_for_language)
         return
-
-    # Find category key from selected text
-    category_key = None
-    for key, values in config.ISSUE_CATEGORIES.items():
-        if values[lang] == selected_text:
-            category_key = key
-            break
-    
-    if not category_key:
-        # Try to find category in OTHER language (in case user switched lang but keyboard didn't update)
-        other_lang = "am" if lang == "en" else "en"
-        for key, values in config.ISSUE_CATEGORIES.items():
-            if values[other_lang] == selected_text:
-                category_key = key
-                # Auto-switch language
-                await state.update_data(language=other_lang)
-                lang = other_lang
-                break
-        
-        if not category_key:
-            await message.answer(config.STRINGS["invalid_selection"][lang])
-            return
+    
+    if button is None or button.action != CATEGORY:
+        await message.answer(config.STRINGS["invalid_selection"][lang])
+        return
+    category_key = button.key
+    
+    # A category in the other language (e.g. an old keyboard): switch to it
+    if button.lang != lang:
+        lang = button.lang
+        await state.update_data(language=lang)
     
     # Check active session
-    active_session = db.get_active_session(user_id)
+    active_session = await session_registry.get_active_session(user_id)
     if active_session:
         await message.answer(config.STRINGS["active_session_exists"][lang])
         return
     
     # Assign counselor
-    counselor_id = assign_counselor(category_key)
+    counselor_id = await assign_counselor(category_key)
     
     if not counselor_id:
         await message.answer(config.STRINGS["no_counselor"][lang])
         return
     
     # Create session
-    session_id = db.create_chat_session(user_id, counselor_id, category_key)
+    session_id = await session_registry.create_session(user_id, counselor_id, category_key)
     
     if not session_id:
         await message.answer(config.STRINGS["session_error"][lang])
         return
     
+    # In chat from now on: the user may start writing as soon as they are notified
+    await state.set_state(UserStates.in_chat)
+    
     # Get anonymous ID
-    anonymous_id = get_or_create_anonymous_id(user_id)
+    anonymous_id = await get_or_create_anonymous_id(user_id)
     
     # Notify user
     await message.answer(
@@ -245,40 +240,39 @@ async def handle_issue_selection(message: Message, state: FSMContext):
     
     # Notify counselor
     try:
-        from bot_instance import get_bot
-        bot = get_bot()
-        await bot.send_message(
-            counselor_id,
-            f"🔔 New counseling request\n\n"
-            f"Anonymous User: <code>{anonymous_id}</code>\n"
-            f"Category: {selected_text} ({lang})\n\n"
-            f"Use /counselor to manage your sessions.",
+        sent = await delivery.send(SendMessage(
+            chat_id=counselor_id,
+            text=(
+                f"🔔 New counseling request\n\n"
+                f"Anonymous User: <code>{anonymous_id}</code>\n"
+                f"Category: {selected_text} ({lang})\n\n"
+                f"Reply to this message to answer, or use /counselor to manage your sessions."
+            ),
             parse_mode="HTML"
-        )
+        ), priority=PRIORITY_CONTROL)
+        relay_index.record(counselor_id, sent.message_id, session_id)
     except Exception as e:
         logger.error(f"Error notifying counselor: {e}")
-    
-    await state.set_state(UserStates.in_chat)
 
 
 @router.message(StateFilter(UserStates.in_chat))
-async def handle_chat_buttons(message: Message, state: FSMContext):
+async def handle_chat_buttons(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle chat buttons (End/Back)."""
     # Get language
     data = await state.get_data()
     lang = data.get("language", "en")
     
-    text = message.text
-    end_text = config.STRINGS["buttons"]["end"][lang]
-    back_text = config.STRINGS["buttons"]["back"][lang]
+    # Only the buttons of the user's language, so chat text in another language is relayed
+    button = catalog.button(message.text)
+    action = button.action if button is not None and button.lang == lang else None
     
-    if text == end_text:
+    if action == END:
         await cmd_end(message, state)
-    elif text == back_text:
+    elif action == BACK:
         await handle_return_back(message, state)
     else:
         # Pass to message handler
-        await handle_user_message(message, state)
+        await handle_user_message(message, state, roles)
 
 
 async def handle_return_back(message: Message, state: FSMContext):
@@ -290,20 +284,18 @@ async def handle_return_back(message: Message, state: FSMContext):
     lang = data.get("language", "en")
     
     try:
-        active_session = db.get_active_session(user_id)
+        active_session = await session_registry.get_active_session(user_id)
         if active_session:
             session_id = active_session["session_id"]
-            db.finish_session(session_id)
+            await session_registry.finish_session(session_id)
             
             # Notify counselor
             try:
-                from bot_instance import get_bot
-                bot = get_bot()
-                anonymous_id = db.get_user_anonymous_id(user_id)
-                await bot.send_message(
-                    active_session["counselor_telegram_id"],
-                    f"ℹ️ Session with {anonymous_id} has been ended by the user (returned back)."
-                )
+                anonymous_id = await profile_cache.get_anonymous_id(user_id)
+                await delivery.send(SendMessage(
+                    chat_id=active_session["counselor_telegram_id"],
+                    text=f"ℹ️ Session with {anonymous_id} has been ended by the user (returned back)."
+                ), priority=PRIORITY_CONTROL)
             except Exception as e:
                 logger.error(f"Error notifying counselor: {e}")
         
@@ -313,13 +305,13 @@ async def handle_return_back(message: Message, state: FSMContext):
             reply_markup=get_main_menu_keyboard(lang)
         )
         await state.set_state(UserStates.waiting_for_issue)
-        
+    
     except Exception as e:
         logger.error(f"Error in handle_return_back: {e}")
         await message.answer(config.STRINGS["error_generic"][lang].format(error=str(e)))
 
 
-async def handle_user_message(message: Message, state: FSMContext):
+async def handle_user_message(message: Message, state: FSMContext, roles: FrozenSet[str]):
     """Handle messages from users in active chat sessions."""
     # Ignore commands
     if message.text and message.text.startswith('/'):
@@ -330,13 +322,13 @@ async def handle_user_message(message: Message, state: FSMContext):
     lang = data.get("language", "en")
     
     # Check if user is blocked
-    if db.is_user_blocked(user_id):
+    if BLOCKED in roles:
         await message.answer(config.STRINGS["blocked"][lang])
         await state.clear()
         return
     
     # Get active session
-    active_session = db.get_active_session(user_id)
+    active_session = await session_registry.get_active_session(user_id)
     if not active_session:
         await message.answer(config.STRINGS["no_active_session"][lang])
         await state.set_state(UserStates.waiting_for_issue)
@@ -344,70 +336,19 @@ async def handle_user_message(message: Message, state: FSMContext):
     
     counselor_id = active_session["counselor_telegram_id"]
     session_id = active_session["session_id"]
-    anonymous_id = db.get_user_anonymous_id(user_id)
-    
-    # Save message to database
-    message_type = "text"
-    content = message.text
-    file_id = None
-    
-    if message.photo:
-        message_type = "photo"
-        content = message.caption or ""
-        file_id = message.photo[-1].file_id
-    elif message.voice:
-        message_type = "voice"
-        content = ""
-        file_id = message.voice.file_id
-    elif message.video:
-        message_type = "video"
-        content = message.caption or ""
-        file_id = message.video.file_id
-    elif message.document:
-        message_type = "document"
-        content = message.caption or ""
-        file_id = message.document.file_id
-    
-    db.save_message(session_id, user_id, message_type, content, file_id)
-    
-    # Forward message to counselor
-    try:
-        from bot_instance import get_bot
-        bot = get_bot()
-        
-        if message_type == "text":
-            await bot.send_message(
-                counselor_id,
-                f"💬 Message from {anonymous_id}:\n\n{content}"
-            )
-        elif message_type == "photo":
-            await bot.send_photo(
-                counselor_id,
-                file_id,
-                caption=f"📷 Photo from {anonymous_id}" + (f":\n{content}" if content else "")
-            )
-        elif message_type == "voice":
-            await bot.send_voice(
-                counselor_id,
-                file_id,
-                caption=f"🎤 Voice message from {anonymous_id}"
-            )
-        elif message_type == "video":
-            await bot.send_video(
-                counselor_id,
-                file_id,
-                caption=f"🎥 Video from {anonymous_id}" + (f":\n{content}" if content else "")
-            )
-        elif message_type == "document":
-            await bot.send_document(
-                counselor_id,
-                file_id,
-                caption=f"📄 Document from {anonymous_id}" + (f":\n{content}" if content else "")
-            )
-    except Exception as e:
+    anonymous_id = await profile_cache.get_anonymous_id(user_id)
+    
+    async def report_failure(e: Exception):
         logger.error(f"Error forwarding message to counselor: {e}")
         error_msg = config.STRINGS["error_generic"][lang].format(error="Message delivery failed")
         await message.answer(error_msg)
+    
+    # Save and forward message to counselor; the counselor can answer by replying to it
+    try:
+        await relay_message(message, session_id, counselor_id, anonymous_id,
+                            index_replies=True, on_error=report_failure)
+    except Exception as e:
+        await report_failure(e)
 
 
 @router.message()
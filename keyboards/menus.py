@@ -6,30 +6,22 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMar
 import config
 
 
-def get_language_keyboard() -> ReplyKeyboardMarkup:
-    """Create keyboard for language selection."""
-    keyboard = ReplyKeyboardMarkup(
+def _build_language_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="English"), KeyboardButton(text="አማርኛ")]
+            [KeyboardButton(text=name) for name in config.LANGUAGES.values()]
         ],
         resize_keyboard=True,
         one_time_keyboard=True
     )
-    return keyboard
 
 
-def get_main_menu_keyboard(lang: str = "en") -> ReplyKeyboardMarkup:
-    """Create the main menu keyboard with issue categories."""
-    # Get categories for the selected language
-    categories = []
-    for key, values in config.ISSUE_CATEGORIES.items():
-        categories.append(values[lang])
-    
+def _build_main_menu_keyboard(lang: str) -> ReplyKeyboardMarkup:
     # Create rows of 2 buttons
     keyboard_buttons = []
     row = []
-    for category in categories:
-        row.append(KeyboardButton(text=category))
+    for values in config.ISSUE_CATEGORIES.values():
+        row.append(KeyboardButton(text=values[lang]))
         if len(row) == 2:
             keyboard_buttons.append(row)
             row = []
@@ -37,15 +29,39 @@ def get_main_menu_keyboard(lang: str = "en") -> ReplyKeyboardMarkup:
         keyboard_buttons.append(row)
     
     # Add "Change Language" button at the bottom
-    change_lang_text = "🌐 Change Language" if lang == "en" else "🌐 ቋንቋ ቀይር"
-    keyboard_buttons.append([KeyboardButton(text=change_lang_text)])
-        
-    keyboard = ReplyKeyboardMarkup(
+    keyboard_buttons.append([KeyboardButton(text=config.STRINGS["buttons"]["change_language"][lang])])
+    
+    return ReplyKeyboardMarkup(
         keyboard=keyboard_buttons,
         resize_keyboard=True,
         one_time_keyboard=True
     )
-    return keyboard
+
+
+def _build_chat_keyboard(lang: str) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text=config.STRINGS["buttons"]["end"][lang])],
+            [KeyboardButton(text=config.STRINGS["buttons"]["back"][lang])]
+        ],
+        resize_keyboard=True
+    )
+
+
+# Built once per language and reused for every message
+_LANGUAGE_KEYBOARD = _build_language_keyboard()
+_MAIN_MENU_KEYBOARDS = {lang: _build_main_menu_keyboard(lang) for lang in config.LANGUAGES}
+_CHAT_KEYBOARDS = {lang: _build_chat_keyboard(lang) for lang in config.LANGUAGES}
+
+
+def get_language_keyboard() -> ReplyKeyboardMarkup:
+    """Get the keyboard for language selection."""
+    return _LANGUAGE_KEYBOARD
+
+
+def get_main_menu_keyboard(lang: str = "en") -> ReplyKeyboardMarkup:
+    """Get the main menu keyboard with issue categories."""
+    return _MAIN_MENU_KEYBOARDS[lang]
 
 
 def get_category_keyboard(lang: str = "en") -> InlineKeyboardMarkup:
@@ -53,7 +69,7 @@ def get_category_keyboard(lang: str = "en") -> InlineKeyboardMarkup:
     buttons = []
     for key, values in config.ISSUE_CATEGORIES.items():
         buttons.append([InlineKeyboardButton(text=values[lang], callback_data=f"category_{key}")])
-        
+    
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
@@ -97,15 +113,5 @@ def get_session_keyboard(session_id: int) -> InlineKeyboardMarkup:
 
 
 def get_chat_keyboard(lang: str = "en") -> ReplyKeyboardMarkup:
-    """Create keyboard for active chat session."""
-    end_text = config.STRINGS["buttons"]["end"][lang]
-    back_text = config.STRINGS["buttons"]["back"][lang]
-    
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=end_text)],
-            [KeyboardButton(text=back_text)]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    """Get the keyboard for an active chat session."""
+    return _CHAT_KEYBOARDS[lang]
@@ -4,15 +4,21 @@ Main entry point for the Anonymous Telegram Counseling Bot.
 
 import logging
 import asyncio
+import signal
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 import config
 from handlers import user_handlers, counselor_handlers, admin_handlers
-from database import Database
-
-from keep_alive import keep_alive
-keep_alive()
+from database import Database, close_all_connections
+from utils.session_registry import session_registry
+from utils.message_journal import message_journal
+from utils.fsm_storage import SQLiteStorage
+from utils.relay_index import relay_index
+from utils.relay import albums
+from utils.session_sweeper import session_sweeper
+from utils import metrics, query_log, roles, tracing
+import web_server
+import supervisor
 
 # Configure logging
 logging.basicConfig(
@@ -26,18 +32,29 @@ from bot_instance import get_bot, set_bot
 
 bot = Bot(token=config.BOT_TOKEN)
 set_bot(bot)  # Set global bot instance
-dp = Dispatcher(storage=MemoryStorage())
+storage = SQLiteStorage()
+dp = Dispatcher(storage=storage)
+metrics.setup_metrics(dp, bot)
+tracing.setup_tracing(dp, bot)
+roles.setup_roles(dp)
+if config.QUERY_ACCOUNTING:
+    query_log.setup_query_accounting(dp)
+metrics.registry.gauge("bot_fsm_states", "Users with a stored FSM state or data.", lambda: storage.size)
 
 # Initialize database
 db = Database()
 
 
-async def main():
-    """Main function to start the bot."""
-    # Register routers (admin first so commands are processed before state handlers)
+def register_routers():
+    """Register routers (admin first so commands are processed before state handlers)."""
     dp.include_router(admin_handlers.router)
     dp.include_router(counselor_handlers.router)
     dp.include_router(user_handlers.router)
+
+
+async def main():
+    """Main function to start the bot."""
+    register_routers()
     
     logger.info("Bot starting...")
     
@@ -50,13 +67,65 @@ async def main():
         logger.error("❌ BOT_TOKEN is not set! Please set it in config.py or environment variable.")
         return
     
-    # Start polling
+    # Several workers: this process only receives updates and routes them
+    if config.WORKERS > 1:
+        logger.info(f"Starting supervisor with {config.WORKERS} workers")
+        await supervisor.Supervisor(bot, worker_process).run()
+        return
+    
+    # Receive updates by webhook if a public URL is configured, otherwise poll
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        await session_registry.load()
+        await storage.load()
+        message_journal.start()
+        session_sweeper.start(storage, bot.id, user_handlers.UserStates.waiting_for_issue)
+        if config.WEBHOOK_URL:
+            await web_server.run_webhook(dp, bot)
+        else:
+            await web_server.run_polling(dp, bot)
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
     finally:
+        await session_sweeper.stop()
+        await albums.drain()
+        await storage.close()
+        await relay_index.close()
+        await message_journal.stop()
         await bot.session.close()
+        close_all_connections()
+
+
+async def run_worker(index: int, queue):
+    """Handle the updates the supervisor routes to worker `index`."""
+    register_routers()
+    # Each worker serves its own metrics on the next ports after the main web server
+    runner = await web_server.start_server(web_server.create_app(), port=config.WORKER_METRICS_PORT + index)
+    try:
+        await storage.load(owns=lambda key: supervisor.shard_of(key.user_id) == index)
+        message_journal.start()
+        # One worker sweeps for all; other shards' FSM states aren't in its storage
+        if index == 0:
+            session_sweeper.start(bot_id=bot.id)
+        logger.info(f"Worker {index} ready")
+        await supervisor.UpdateConsumer(dp, bot).run(queue)
+    except Exception as e:
+        logger.error(f"Error in worker {index}: {e}")
+    finally:
+        await runner.cleanup()
+        await session_sweeper.stop()
+        await albums.drain()
+        await storage.close()
+        await relay_index.close()
+        await message_journal.stop()
+        await bot.session.close()
+        close_all_connections()
+
+
+def worker_process(index: int, queue):
+    """Entry point of a worker process (started by the supervisor)."""
+    # Ctrl+C reaches every process; workers stop when the supervisor tells them to
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, queue))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""
+Schema migrations for the Anonymous Telegram Counseling Bot.
+Each migration runs once; the applied version is stored in PRAGMA user_version.
+"""
+
+import sqlite3
+import logging
+from typing import Callable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _copy_counselor_categories(conn: sqlite3.Connection):
+    """Fill counselor_categories from the comma-joined counselors.categories column."""
+    rows = conn.execute("SELECT telegram_id, categories FROM counselors").fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO counselor_categories (counselor_id, category) VALUES (?, ?)",
+        [
+            (telegram_id, category.strip())
+            for telegram_id, categories in rows
+            for category in (categories or "").split(",")
+            if category.strip()
+        ]
+    )
+
+# A step is either an SQL statement or a callable taking the connection
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+# (version, description, steps) - append new migrations, never edit applied ones
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "Create base tables", [
+        # Users table - stores Telegram users with their anonymous IDs
+        """CREATE TABLE IF NOT EXISTS users (
+               telegram_id INTEGER PRIMARY KEY,
+               anonymous_id TEXT UNIQUE NOT NULL,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               is_blocked INTEGER DEFAULT 0
+           )""",
+        # Counselors table - stores counselor information
+        """CREATE TABLE IF NOT EXISTS counselors (
+               telegram_id INTEGER PRIMARY KEY,
+               categories TEXT NOT NULL,
+               is_active INTEGER DEFAULT 1,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        # Chat sessions table - stores active chat sessions
+        """CREATE TABLE IF NOT EXISTS chat_sessions (
+               session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+               user_telegram_id INTEGER NOT NULL,
+               counselor_telegram_id INTEGER NOT NULL,
+               category TEXT NOT NULL,
+               status TEXT DEFAULT 'active',
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               finished_at TIMESTAMP,
+               FOREIGN KEY (user_telegram_id) REFERENCES users(telegram_id),
+               FOREIGN KEY (counselor_telegram_id) REFERENCES counselors(telegram_id)
+           )""",
+        # Messages table - stores all messages in chat sessions
+        """CREATE TABLE IF NOT EXISTS messages (
+               message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+               session_id INTEGER NOT NULL,
+               sender_telegram_id INTEGER NOT NULL,
+               message_type TEXT NOT NULL,
+               content TEXT,
+               file_id TEXT,
+               sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (session_id) REFERENCES chat_sessions(session_id)
+           )""",
+    ]),
+    (2, "Index chat sessions and messages", [
+        # get_active_session
+        """CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_status
+           ON chat_sessions (user_telegram_id, status, created_at)""",
+        # get_counselor_sessions
+        """CREATE INDEX IF NOT EXISTS idx_chat_sessions_counselor_status
+           ON chat_sessions (counselor_telegram_id, status, created_at)""",
+        # get_all_active_sessions
+        """CREATE INDEX IF NOT EXISTS idx_chat_sessions_status_created
+           ON chat_sessions (status, created_at)""",
+        # iter_session_export
+        """CREATE INDEX IF NOT EXISTS idx_chat_sessions_status_finished
+           ON chat_sessions (status, finished_at)""",
+        # get_session_messages
+        """CREATE INDEX IF NOT EXISTS idx_messages_session_sent
+           ON messages (session_id, sent_at)""",
+    ]),
+    (3, "Normalize counselor categories", [
+        """CREATE TABLE IF NOT EXISTS counselor_categories (
+               category TEXT NOT NULL,
+               counselor_id INTEGER NOT NULL,
+               PRIMARY KEY (category, counselor_id),
+               FOREIGN KEY (counselor_id) REFERENCES counselors(telegram_id)
+           ) WITHOUT ROWID""",
+        # remove_counselor / add_counselor clear a counselor's rows
+        """CREATE INDEX IF NOT EXISTS idx_counselor_categories_counselor
+           ON counselor_categories (counselor_id)""",
+        _copy_counselor_categories,
+    ]),
+    (4, "Add persistent ID counters", [
+        """CREATE TABLE IF NOT EXISTS id_counters (
+               name TEXT PRIMARY KEY,
+               next_value INTEGER NOT NULL DEFAULT 0
+           )""",
+    ]),
+    (5, "Add persistent FSM storage", [
+        # thread_id is 0 for chats without topics
+        """CREATE TABLE IF NOT EXISTS fsm_states (
+               bot_id INTEGER NOT NULL,
+               chat_id INTEGER NOT NULL,
+               user_id INTEGER NOT NULL,
+               thread_id INTEGER NOT NULL DEFAULT 0,
+               destiny TEXT NOT NULL,
+               state TEXT,
+               data TEXT NOT NULL DEFAULT '{}',
+               PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+           ) WITHOUT ROWID""",
+    ]),
+    (6, "Add relayed message index", [
+        # Messages the bot relayed to a counselor, so replies to them reach the right session
+        """CREATE TABLE IF NOT EXISTS relay_messages (
+               chat_id INTEGER NOT NULL,
+               message_id INTEGER NOT NULL,
+               session_id INTEGER NOT NULL,
+               PRIMARY KEY (chat_id, message_id),
+               FOREIGN KEY (session_id) REFERENCES chat_sessions(session_id)
+           ) WITHOUT ROWID""",
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the schema version stored in the database file."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply all pending migrations, each in its own transaction.
+    Returns the resulting schema version.
+    """
+    version = get_schema_version(conn)
+    for target, description, steps in MIGRATIONS:
+        if target <= version:
+            continue
+        
+        # Take the write lock first so concurrent processes migrate only once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= target:
+                conn.rollback()
+                version = target
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {target} ({description}) failed", exc_info=True)
+            raise
+        
+        version = target
+        logger.info(f"Applied migration {target}: {description}")
+    return version
@@ -0,0 +1,158 @@
+"""
+Multi-process mode for the Anonymous Telegram Counseling Bot.
+
+The supervisor receives updates (by webhook, or with a single poller) and
+routes each one to a worker process chosen by user ID, so all updates from a
+user are handled by the same worker, in order. Workers run the usual
+dispatcher and share session and assignment state through the database.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+
+import config
+import web_server
+
+logger = logging.getLogger(__name__)
+
+# How often the supervisor checks that its workers are alive (seconds)
+WATCHDOG_INTERVAL = 5
+
+
+def update_user_id(update: Dict[str, Any]) -> int:
+    """Get the ID of the user (or else the chat) an update comes from; 0 if it has neither."""
+    for name, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def shard_of(user_id: int, workers: int = config.WORKERS) -> int:
+    """Get the index of the worker that handles a user."""
+    return user_id % workers
+
+
+class UpdateConsumer:
+    """
+    Feeds updates routed to this worker into the dispatcher. Updates from
+    different users are processed concurrently, those from one user strictly
+    one after another.
+    """
+    
+    def __init__(self, dp: Dispatcher, bot: Bot, max_concurrent: int = config.WEBHOOK_MAX_CONCURRENT_UPDATES):
+        self.dp = dp
+        self.bot = bot
+        self._slots = asyncio.Semaphore(max_concurrent)
+        # user ID -> task for that user's latest update
+        self._tails: Dict[int, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def run(self, queue: multiprocessing.Queue):
+        """Process updates from the queue until the supervisor sends None."""
+        loop = asyncio.get_running_loop()
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            await self._slots.acquire()
+            user_id = update_user_id(update)
+            task = asyncio.create_task(self._feed(update, self._tails.get(user_id)))
+            self._tails[user_id] = task
+            self._tasks.add(task)
+            task.add_done_callback(lambda t, user_id=user_id: self._finished(user_id, t))
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+    
+    async def _feed(self, update: Dict[str, Any], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Error handling update {update.get('update_id')}: {e}")
+    
+    def _finished(self, user_id: int, task: asyncio.Task):
+        self._slots.release()
+        self._tasks.discard(task)
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+
+class Supervisor:
+    """Starts the worker processes, restarts any that die and routes updates to them."""
+    
+    def __init__(self, bot: Bot, worker_target: Callable[[int, multiprocessing.Queue], None],
+                 workers: int = config.WORKERS):
+        self.bot = bot
+        self.worker_target = worker_target
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = [self._context.Queue() for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+    
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=self.worker_target,
+            args=(index, self._queues[index]),
+            name=f"worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+    
+    def route(self, update: Dict[str, Any]):
+        """Send an update to the worker that handles its user."""
+        self._queues[shard_of(update_user_id(update), self.workers)].put(update)
+    
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self._start_worker(index)
+    
+    async def _poll(self):
+        await self.bot.delete_webhook(drop_pending_updates=True)
+        runner = await web_server.start_server(web_server.create_app())
+        try:
+            # Same reader (offsets, backoff) as Dispatcher.start_polling
+            async for update in Dispatcher._listen_updates(self.bot):
+                self.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+        finally:
+            await runner.cleanup()
+    
+    async def run(self):
+        """Receive and route updates until cancelled, then stop the workers."""
+        for index in range(self.workers):
+            self._start_worker(index)
+        watchdog = asyncio.create_task(self._watchdog())
+        try:
+            if config.WEBHOOK_URL:
+                await web_server.serve_webhook(self.bot, web_server.create_routing_app(self.route))
+            else:
+                await self._poll()
+        finally:
+            watchdog.cancel()
+            for queue in self._queues:
+                queue.put(None)
+            await asyncio.to_thread(self._join)
+            await self.bot.session.close()
+    
+    def _join(self):
+        for index, process in enumerate(self._processes):
+            process.join(timeout=30)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop, terminating")
+                process.terminate()
+        logger.info("All workers stopped")
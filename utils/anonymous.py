@@ -1,38 +1,107 @@
 """
 Utility functions for anonymous ID generation and management.
+
+IDs are allocated without probing the database: a persisted counter is
+reserved in blocks and each counter value is mapped to a unique ID by a
+keyed Feistel permutation, so IDs look random but never repeat.
 """
 
-import random
-import string
+import asyncio
+import hashlib
 import config
-from database import Database
+from database import AsyncDatabase
+from utils.profile_cache import profile_cache
+
+db = AsyncDatabase()
+
+
+class AnonymousIdAllocator:
+    """
+    Maps counter values 0, 1, 2, ... to unique anonymous IDs.
+    The first 9 * 10^(n-1) values become n-digit IDs (n = ANONYMOUS_ID_LENGTH),
+    the next ones (n+1)-digit IDs, and so on, so the ID space never runs out.
+    """
+    
+    COUNTER_NAME = "anonymous_id"
+    ROUNDS = 4
+    
+    def __init__(self, min_digits: int = config.ANONYMOUS_ID_LENGTH,
+                 batch_size: int = config.ANONYMOUS_ID_BATCH_SIZE,
+                 secret: str = config.ANONYMOUS_ID_SECRET):
+        self.min_digits = min_digits
+        self.batch_size = batch_size
+        self._key = hashlib.blake2b(secret.encode(), digest_size=32).digest()
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+    
+    async def reserve(self, count: int) -> range:
+        """Reserve a block of counter values directly from the database."""
+        start = await db.reserve_id_block(self.COUNTER_NAME, count)
+        return range(start, start + count)
+    
+    async def allocate(self) -> str:
+        """Get the next unused anonymous ID."""
+        async with self._lock:
+            if self._next >= self._end:
+                block = await self.reserve(self.batch_size)
+                self._next, self._end = block.start, block.stop
+            value = self._next
+            self._next += 1
+        return self.format(value)
+    
+    def format(self, value: int) -> str:
+        """Turn a counter value into an ID like User-2941."""
+        digits = self.min_digits
+        size = 9 * 10 ** (digits - 1)
+        while value >= size:
+            value -= size
+            digits += 1
+            size = 9 * 10 ** (digits - 1)
+        number = 10 ** (digits - 1) + self._permute(value, size)
+        return f"{config.ANONYMOUS_ID_PREFIX}{number}"
+    
+    def _permute(self, value: int, domain: int) -> int:
+        """Keyed bijection on range(domain): balanced Feistel network with cycle walking."""
+        bits = max(2, (domain - 1).bit_length())
+        bits += bits % 2
+        half = bits // 2
+        mask = (1 << half) - 1
+        while True:
+            left, right = value >> half, value & mask
+            for round_number in range(self.ROUNDS):
+                left, right = right, left ^ (self._round(round_number, half, right) & mask)
+            value = (left << half) | right
+            # Outside the domain: keep permuting until we land back inside it
+            if value < domain:
+                return value
+    
+    def _round(self, round_number: int, half: int, value: int) -> int:
+        data = f"{round_number}:{half}:{value}".encode()
+        return int.from_bytes(hashlib.blake2b(data, key=self._key, digest_size=8).digest(), "big")
 
-db = Database()
 
+allocator = AnonymousIdAllocator()
 
-def generate_anonymous_id() -> str:
+
+async def generate_anonymous_id() -> str:
     """
     Generate a unique anonymous ID for a user.
-    Format: User-XXXX where XXXX is a random 4-digit number.
+    Format: User-XXXX where XXXX is a number that looks random.
     """
-    while True:
-        # Generate random 4-digit number
-        random_number = random.randint(1000, 9999)
-        anonymous_id = f"{config.ANONYMOUS_ID_PREFIX}{random_number}"
-        
-        # Check if ID already exists
-        if db.get_user_telegram_id(anonymous_id) is None:
-            return anonymous_id
+    return await allocator.allocate()
 
 
-def get_or_create_anonymous_id(telegram_id: int) -> str:
+async def get_or_create_anonymous_id(telegram_id: int) -> str:
     """
     Get existing anonymous ID for a user or create a new one.
     Returns the anonymous ID.
     """
-    anonymous_id = db.get_user_anonymous_id(telegram_id)
-    if anonymous_id is None:
-        anonymous_id = generate_anonymous_id()
-        db.create_user(telegram_id, anonymous_id)
+    anonymous_id = await profile_cache.get_anonymous_id(telegram_id)
+    while anonymous_id is None:
+        candidate = await generate_anonymous_id()
+        if not await db.create_user(telegram_id, candidate):
+            return candidate
+        # INSERT OR IGNORE skips IDs already taken by older, randomly generated ones
+        anonymous_id = await profile_cache.get_anonymous_id(telegram_id)
     return anonymous_id
-
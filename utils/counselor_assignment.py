@@ -1,52 +1,160 @@
 """
 Utility functions for counselor assignment logic.
-Implements round-robin and random assignment strategies.
+Implements least-loaded, round-robin and random assignment strategies.
+
+Open-session counts per counselor are kept in memory and updated by the
+session registry when sessions are created or finished, so picking a
+counselor never scans the session table. With several worker processes the
+counts and counselor lists are re-read from the database for each pick.
 """
 
+import heapq
+import itertools
+import logging
 import random
-from typing import Optional, List
-from database import Database
+from typing import Optional, List, Dict, Tuple
+from database import AsyncDatabase
+from utils.session_registry import session_registry
 import config
 
-db = Database()
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
 
 
-def assign_counselor(category: str, assignment_method: str = "round_robin") -> Optional[int]:
+class AssignmentEngine:
+    """Per-counselor load counters with a least-loaded heap and round-robin cursor per category."""
+    
+    def __init__(self, max_sessions: int = config.COUNSELOR_MAX_SESSIONS, shared: bool = config.WORKERS > 1):
+        self.max_sessions = max_sessions  # 0 means no cap
+        self.shared = shared  # other processes open and close sessions too
+        self.loaded = False
+        self._load: Dict[int, int] = {}
+        self._version: Dict[int, int] = {}
+        self._rosters: Dict[str, List[int]] = {}
+        self._categories_of: Dict[int, List[str]] = {}
+        # category -> heap of (load, seq, counselor_id, version); stale entries are skipped lazily
+        self._heaps: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._seq = itertools.count()
+    
+    async def load(self):
+        """Count open sessions per counselor from the session registry."""
+        self._load.clear()
+        for session in await session_registry.get_all_active_sessions():
+            counselor_id = session["counselor_telegram_id"]
+            self._load[counselor_id] = self._load.get(counselor_id, 0) + 1
+        self.invalidate_rosters()
+        self.loaded = True
+    
+    def invalidate_rosters(self):
+        """Forget cached counselor lists (call after adding or removing counselors)."""
+        self._rosters.clear()
+        self._categories_of.clear()
+        self._heaps.clear()
+        self._cursors.clear()
+    
+    async def _refresh(self):
+        # Pick up sessions and counselors changed by other worker processes;
+        # round-robin cursors are kept so rotation continues
+        self._load = await db.get_counselor_loads()
+        self._rosters.clear()
+        self._categories_of.clear()
+        self._heaps.clear()
+        self.loaded = True
+    
+    async def _get_roster(self, category: str) -> List[int]:
+        roster = self._rosters.get(category)
+        if roster is None:
+            # Get counselors from database first
+            roster = await db.get_counselors_by_category(category)
+            # If no counselors in database, check config
+            if not roster:
+                roster = list(config.COUNSELOR_CATEGORIES.get(category, []))
+            self._rosters[category] = roster
+            for counselor_id in roster:
+                self._categories_of.setdefault(counselor_id, []).append(category)
+            self._heaps[category] = [self._entry(counselor_id) for counselor_id in roster]
+            heapq.heapify(self._heaps[category])
+        return roster
+    
+    def _entry(self, counselor_id: int) -> Tuple[int, int, int, int]:
+        return (self._load.get(counselor_id, 0), next(self._seq), counselor_id, self._version.get(counselor_id, 0))
+    
+    def _has_capacity(self, counselor_id: int) -> bool:
+        return not self.max_sessions or self._load.get(counselor_id, 0) < self.max_sessions
+    
+    def _update_load(self, counselor_id: int, delta: int):
+        if not self.loaded:
+            return  # load() will count this session
+        self._load[counselor_id] = max(0, self._load.get(counselor_id, 0) + delta)
+        self._version[counselor_id] = self._version.get(counselor_id, 0) + 1
+        for category in self._categories_of.get(counselor_id, []):
+            heap = self._heaps[category]
+            heapq.heappush(heap, self._entry(counselor_id))
+            # Drop accumulated stale entries now and then
+            if len(heap) > 4 * len(self._rosters[category]) + 16:
+                self._heaps[category] = [self._entry(cid) for cid in self._rosters[category]]
+                heapq.heapify(self._heaps[category])
+    
+    # Session registry listener
+    def session_opened(self, session: Dict):
+        self._update_load(session["counselor_telegram_id"], 1)
+    
+    def session_closed(self, session: Dict):
+        self._update_load(session["counselor_telegram_id"], -1)
+    
+    def get_load(self, counselor_id: int) -> int:
+        """Get the number of open sessions for a counselor."""
+        return self._load.get(counselor_id, 0)
+    
+    async def assign(self, category: str, assignment_method: str) -> Optional[int]:
+        """Pick a counselor for a category, or None if nobody has capacity."""
+        if self.shared:
+            await self._refresh()
+        elif not self.loaded:
+            await self.load()
+        roster = await self._get_roster(category)
+        if not roster:
+            return None
+        
+        if assignment_method == "random":
+            available = [cid for cid in roster if self._has_capacity(cid)]
+            return random.choice(available) if available else None
+        
+        if assignment_method == "round_robin":
+            start = self._cursors.get(category, 0)
+            for offset in range(len(roster)):
+                index = (start + offset) % len(roster)
+                if self._has_capacity(roster[index]):
+                    self._cursors[category] = index + 1
+                    return roster[index]
+            return None
+        
+        # least_loaded: the heap top is the counselor with the fewest open sessions
+        heap = self._heaps[category]
+        while heap:
+            load, _, counselor_id, version = heap[0]
+            if version != self._version.get(counselor_id, 0):
+                heapq.heappop(heap)
+                continue
+            return counselor_id if self._has_capacity(counselor_id) else None
+        return None
+
+
+assignment_engine = AssignmentEngine()
+session_registry.add_listener(assignment_engine)
+
+
+async def assign_counselor(category: str, assignment_method: str = config.ASSIGNMENT_METHOD) -> Optional[int]:
     """
     Assign a counselor to a user based on category.
     
     Args:
         category: The issue category
-        assignment_method: "round_robin" or "random"
+        assignment_method: "least_loaded", "round_robin" or "random"
     
     Returns:
         Counselor Telegram ID or None if no counselor available
     """
-    # Get counselors from database first
-    counselor_ids = db.get_counselors_by_category(category)
-    
-    # If no counselors in database, check config
-    if not counselor_ids:
-        counselor_ids = config.COUNSELOR_CATEGORIES.get(category, [])
-    
-    if not counselor_ids:
-        return None
-    
-    if assignment_method == "random":
-        return random.choice(counselor_ids)
-    else:  # round_robin
-        # Simple round-robin: get active sessions for this category
-        # and assign to counselor with least active sessions
-        active_sessions = db.get_all_active_sessions()
-        category_sessions = [s for s in active_sessions if s["category"] == category]
-        
-        # Count sessions per counselor
-        counselor_session_count = {}
-        for counselor_id in counselor_ids:
-            counselor_session_count[counselor_id] = sum(
-                1 for s in category_sessions if s["counselor_telegram_id"] == counselor_id
-            )
-        
-        # Return counselor with least sessions
-        return min(counselor_ids, key=lambda cid: counselor_session_count.get(cid, 0))
-
+    return await assignment_engine.assign(category, assignment_method)
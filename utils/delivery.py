@@ -0,0 +1,190 @@
+"""
+Rate-limit-aware delivery of outbound Telegram messages.
+
+Every relayed message and session notice goes through one dispatcher that
+enforces Telegram's global and per-chat flood limits with token buckets,
+keeps messages to the same chat in FIFO order, lets session-control notices
+overtake relayed messages for the global budget, and retries after
+TelegramRetryAfter instead of failing.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from bot_instance import get_bot
+from utils import metrics, tracing
+import config
+
+logger = logging.getLogger(__name__)
+
+# Priorities (lower is served first)
+PRIORITY_CONTROL = 0  # session started / ended notices
+PRIORITY_RELAY = 1  # relayed chat messages
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self):
+        """Consume one token (call when delay() is 0)."""
+        self._refill()
+        self.tokens -= 1
+    
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class PriorityLimiter:
+    """A shared token bucket whose waiters are served by priority, then arrival order."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.bucket = TokenBucket(rate, capacity)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+    
+    async def acquire(self, priority: int):
+        if not self._waiters and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run(), context=contextvars.Context())
+        await future
+    
+    async def _run(self):
+        while self._waiters:
+            delay = self.bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # cancelled while waiting
+            self.bucket.take()
+            future.set_result(None)
+
+
+class _ChatLane:
+    """Pending deliveries for one chat, sent strictly in order."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.bucket = TokenBucket(rate, capacity)
+        self.queue: Deque[Tuple[TelegramMethod, int, asyncio.Future]] = deque()
+        self.worker: Optional[asyncio.Task] = None
+        self.paused_until = 0.0
+
+
+class DeliveryDispatcher:
+    """Central outbound queue for relayed messages and session notices."""
+    
+    # Each worker process gets an equal share of the bot's global limit
+    def __init__(self, global_rate: float = config.DELIVERY_GLOBAL_RATE / config.WORKERS,
+                 chat_rate: float = config.DELIVERY_CHAT_RATE,
+                 chat_burst: float = config.DELIVERY_CHAT_BURST,
+                 max_retries: int = config.DELIVERY_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = PriorityLimiter(global_rate, global_rate)
+        self._lanes: Dict[int, _ChatLane] = {}
+    
+    async def send(self, method: TelegramMethod, priority: int = PRIORITY_RELAY) -> Any:
+        """Queue an API method (e.g. SendMessage(...)) and wait for its result."""
+        chat_id = method.chat_id
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            self._prune()
+            lane = self._lanes[chat_id] = _ChatLane(self.chat_rate, self.chat_burst)
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.append((method, priority, future))
+        if lane.worker is None or lane.worker.done():
+            # The worker outlives this update, so don't let it inherit its trace
+            lane.worker = asyncio.create_task(self._drain(lane), context=contextvars.Context())
+        start = time.perf_counter()
+        try:
+            return await future
+        finally:
+            tracing.record("api", type(method).__name__, time.perf_counter() - start)
+    
+    def pending(self) -> int:
+        """Number of deliveries waiting in all chat lanes."""
+        return sum(len(lane.queue) for lane in self._lanes.values())
+    
+    def _prune(self):
+        # Forget idle lanes whose limits have fully recovered
+        if len(self._lanes) < 10000:
+            return
+        for chat_id, lane in list(self._lanes.items()):
+            if not lane.queue and (lane.worker is None or lane.worker.done()) and lane.bucket.full:
+                del self._lanes[chat_id]
+    
+    async def _drain(self, lane: _ChatLane):
+        bot = get_bot()
+        while lane.queue:
+            method, priority, future = lane.queue[0]
+            attempt = 0
+            while not future.done():
+                # Per-chat limit and any Retry-After pause for this chat
+                delay = max(lane.bucket.delay(), lane.paused_until - time.monotonic())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                lane.bucket.take()
+                await self._global.acquire(priority)
+                try:
+                    result = await bot(method)
+                except TelegramRetryAfter as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        self._resolve(future, error=e)
+                        break
+                    logger.warning(f"Flood limit for chat {method.chat_id}, retrying in {e.retry_after}s")
+                    lane.paused_until = time.monotonic() + e.retry_after
+                except Exception as e:
+                    self._resolve(future, error=e)
+                else:
+                    self._resolve(future, result=result)
+            lane.queue.popleft()
+    
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        # The caller may have given up (cancelled) while we were sending
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+delivery = DeliveryDispatcher()
+metrics.registry.gauge("bot_delivery_pending", "Outbound messages waiting to be sent.", delivery.pending)
@@ -0,0 +1,121 @@
+"""
+Persistent FSM storage for aiogram.
+States and data live in memory, so reads never touch the database, and are
+written to SQLite shortly after they change. Changes made in quick succession
+(e.g. set_state right after update_data) are written together.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import AsyncDatabase
+import config
+
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage served from memory and persisted to the fsm_states table."""
+    
+    def __init__(self, flush_interval_ms: int = config.FSM_FLUSH_INTERVAL_MS):
+        self.flush_interval = flush_interval_ms / 1000
+        self._records: Dict[StorageKey, _Record] = {}
+        self._dirty: Set[StorageKey] = set()
+        self._flusher: Optional[asyncio.Task] = None
+    
+    async def load(self, owns: Optional[Callable[[StorageKey], bool]] = None):
+        """
+        Load stored states into memory (call once at startup).
+        A worker process passes `owns` to load only the keys routed to it.
+        """
+        self._records.clear()
+        for bot_id, chat_id, user_id, thread_id, destiny, state, data in await db.get_fsm_records():
+            key = StorageKey(bot_id=bot_id, chat_id=chat_id, user_id=user_id,
+                             thread_id=thread_id or None, destiny=destiny)
+            if owns is None or owns(key):
+                self._records[key] = _Record(state=state, data=json.loads(data))
+        logger.info(f"Loaded {len(self._records)} FSM states")
+    
+    @property
+    def size(self) -> int:
+        """Number of users with a stored state or data."""
+        return len(self._records)
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._records.setdefault(key, _Record())
+        record.state = state.state if isinstance(state, State) else state
+        self._changed(key)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._records.get(key)
+        return record.state if record else None
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._records.setdefault(key, _Record())
+        record.data = data.copy()
+        self._changed(key)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._records.get(key)
+        return record.data.copy() if record else {}
+    
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        record = self._records.setdefault(key, _Record())
+        record.data.update(data)
+        self._changed(key)
+        return record.data.copy()
+    
+    async def close(self) -> None:
+        """Write any pending changes (called on shutdown)."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+    
+    def _changed(self, key: StorageKey):
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later(), context=contextvars.Context())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+    
+    async def flush(self):
+        """Write all changed records now."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts = []
+        deletes = []
+        for key in keys:
+            row = (key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny)
+            record = self._records.get(key)
+            if record is None or (record.state is None and not record.data):
+                # Cleared: forget it instead of storing an empty record
+                self._records.pop(key, None)
+                deletes.append(row)
+            else:
+                upserts.append(row + (record.state, json.dumps(record.data, ensure_ascii=False)))
+        if not await db.save_fsm_records(upserts, deletes):
+            # Keep the changes and try again with the next write
+            self._dirty |= keys
+            logger.error(f"Failed to save {len(keys)} FSM states, will retry")
@@ -0,0 +1,56 @@
+"""
+Compiled string catalog.
+Built once at import from config.LANGUAGES, ISSUE_CATEGORIES and
+STRINGS["buttons"]: maps the text of any button, in any language, to what it
+does, so handlers resolve a pressed button with one dict lookup.
+"""
+
+from typing import Dict, NamedTuple, Optional
+
+import config
+
+# Button actions
+LANGUAGE = "language"        # key: language code
+CATEGORY = "category"        # key: category key
+END = "end"
+BACK = "back"
+CHANGE_LANGUAGE = "change_language"
+
+
+class Button(NamedTuple):
+    """What a button text means: action, its argument (key) and the language of the text."""
+    action: str
+    key: str
+    lang: str
+
+
+class Catalog:
+    """Button text -> Button, and display names of categories."""
+    
+    def __init__(self):
+        self._buttons: Dict[str, Button] = {}
+        for lang, name in config.LANGUAGES.items():
+            self._add(name, Button(LANGUAGE, lang, lang))
+        for key, names in config.ISSUE_CATEGORIES.items():
+            for lang, name in names.items():
+                self._add(name, Button(CATEGORY, key, lang))
+        for action, names in config.STRINGS["buttons"].items():
+            for lang, name in names.items():
+                self._add(name, Button(action, action, lang))
+    
+    def _add(self, text: str, button: Button):
+        if text in self._buttons and self._buttons[text] != button:
+            raise ValueError(f"Button text {text!r} is used for {self._buttons[text]} and {button}")
+        self._buttons[text] = button
+    
+    def button(self, text: Optional[str]) -> Optional[Button]:
+        """Resolve a message text to the button it is, or None."""
+        return self._buttons.get(text) if text else None
+    
+    def category_name(self, key: str, lang: str = "en") -> str:
+        """Display name of a category (the key itself if unknown)."""
+        names = config.ISSUE_CATEGORIES.get(key)
+        return names.get(lang, key) if names else key
+
+
+catalog = Catalog()
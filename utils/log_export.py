@@ -0,0 +1,82 @@
+"""
+Streaming chat log export.
+Writes finished sessions as newline-delimited JSON (one session per line),
+gzip-compressed, into a temporary file without holding the export in memory.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional, Tuple
+
+from database import AsyncDatabase
+import config
+
+db = AsyncDatabase()
+
+
+def write_export(since: Optional[str] = None, until: Optional[str] = None,
+                 limit: Optional[int] = None, compress: bool = config.EXPORT_COMPRESS) -> Tuple[str, int]:
+    """
+    Export finished sessions to a temporary NDJSON file.
+    The first line is a header; each further line is one session with its messages.
+    Returns (file path, number of sessions). The caller deletes the file.
+    """
+    suffix = ".ndjson.gz" if compress else ".ndjson"
+    prefix = f"logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix)
+    os.close(fd)
+    
+    opener = gzip.open if compress else open
+    total = 0
+    try:
+        with opener(path, "wt", encoding="utf-8") as f:
+            header = {"export_date": datetime.now().isoformat(), "since": since, "until": until, "limit": limit}
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            
+            session = None
+            for row in db.sync.iter_session_export(since=since, until=until, limit=limit):
+                if session is None or session["session_id"] != row[0]:
+                    if session is not None:
+                        f.write(json.dumps(session, ensure_ascii=False) + "\n")
+                        total += 1
+                    session = {
+                        "session_id": row[0],
+                        "user_anonymous_id": row[2],
+                        "user_telegram_id": row[1],  # Admin can see real IDs
+                        "counselor_telegram_id": row[3],
+                        "category": row[4],
+                        "created_at": row[5],
+                        "finished_at": row[6],
+                        "messages": []
+                    }
+                if row[8] is not None:
+                    session["messages"].append({
+                        "sender_telegram_id": row[7],
+                        "message_type": row[8],
+                        "content": row[9],
+                        "file_id": row[10],
+                        "sent_at": row[11]
+                    })
+            if session is not None:
+                f.write(json.dumps(session, ensure_ascii=False) + "\n")
+                total += 1
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        # Runs on a default-executor thread, not the database thread; don't leave its connection open
+        db.sync.release_connection()
+    return path, total
+
+
+async def export_logs(since: Optional[str] = None, until: Optional[str] = None,
+                      limit: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Run write_export in a worker thread (reading with its own connection), so a
+    long export doesn't hold up the database thread.
+    """
+    return await asyncio.to_thread(write_export, since, until, limit)
@@ -0,0 +1,106 @@
+"""
+Write-behind journal for chat messages.
+Handlers append messages to an in-memory queue; a background writer stores
+them with one executemany transaction per batch, so relaying a message never
+waits for a commit.
+"""
+
+import asyncio
+import contextvars
+import logging
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+
+from database import AsyncDatabase
+from utils import metrics
+import config
+
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
+
+
+class MessageJournal:
+    """Buffers messages and flushes every `batch_size` messages or `interval_ms` milliseconds."""
+    
+    RETRIES = 3
+    
+    def __init__(self, batch_size: int = config.MESSAGE_FLUSH_BATCH_SIZE,
+                 interval_ms: int = config.MESSAGE_FLUSH_INTERVAL_MS,
+                 max_pending: int = config.MESSAGE_JOURNAL_MAX_PENDING):
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the background writer (done lazily on the first append)."""
+        if self._writer is None or self._writer.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_pending)
+            # Long-lived: start it outside the current update's context
+            self._writer = asyncio.create_task(self._run(), context=contextvars.Context())
+    
+    async def append(self, session_id: int, sender_telegram_id: int, message_type: str,
+                     content: str = None, file_id: str = None):
+        """Queue a message for saving. Waits only if the queue is full."""
+        self.start()
+        # Stamp now so the stored order matches the order messages were relayed
+        sent_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        await self._queue.put((session_id, sender_telegram_id, message_type, content, file_id, sent_at))
+    
+    def pending(self) -> int:
+        """Number of messages waiting to be written."""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    async def flush(self):
+        """Wait until everything queued so far has been written."""
+        if self._queue is not None and self._writer is not None and not self._writer.done():
+            await self._queue.join()
+    
+    async def stop(self):
+        """Drain the queue and stop the writer (called on shutdown)."""
+        if self._writer is None:
+            return
+        await self.flush()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+        logger.info("Message journal drained")
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+    
+    async def _write(self, batch: List[Tuple]):
+        for attempt in range(1, self.RETRIES + 1):
+            if await db.save_messages(batch):
+                return
+            await asyncio.sleep(0.1 * attempt)
+        logger.error(f"Dropped {len(batch)} messages after {self.RETRIES} failed writes")
+
+
+message_journal = MessageJournal()
+metrics.registry.gauge("bot_message_journal_pending", "Messages waiting to be saved.", message_journal.pending)
@@ -0,0 +1,232 @@
+"""
+Minimal Prometheus metrics for the bot.
+Counters and histograms are updated in place (from any thread); gauges are
+read from callbacks when /metrics is scraped. render() produces the Prometheus
+text exposition format.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets in seconds, from a cached read to a slow Telegram call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up, per label set."""
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    async def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = self.header()
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies) in cumulative buckets."""
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts, sum]
+        self._values: Dict[LabelValues, List] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+    
+    async def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1]) for key, entry in self._values.items()]
+        lines = self.header()
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """
+    A current value read from a callback at scrape time. The callback (plain or
+    async) returns a number, or a dict of label values -> number.
+    """
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Union[GaugeValue, Awaitable[GaugeValue]]],
+                 labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+    
+    async def render(self) -> List[str]:
+        value = self.callback()
+        if asyncio.iscoroutine(value):
+            value = await value
+        if not isinstance(value, dict):
+            value = {(): value}
+        lines = self.header()
+        for key, number in value.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(number)}")
+        return lines
+
+
+class MetricsRegistry:
+    """All metrics exposed on /metrics."""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def gauge(self, name: str, documentation: str, callback: Callable, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, callback, labelnames))
+    
+    async def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(await metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+update_duration = registry.histogram(
+    "bot_update_handler_duration_seconds", "Time spent in update handlers.", ["event", "handler"]
+)
+update_errors = registry.counter(
+    "bot_update_handler_errors_total", "Update handlers that raised an exception.", ["event", "handler"]
+)
+db_duration = registry.histogram(
+    "bot_db_query_duration_seconds", "Time spent executing Database methods.", ["method"]
+)
+api_duration = registry.histogram(
+    "bot_api_request_duration_seconds", "Time spent on Telegram Bot API requests.", ["method"]
+)
+api_errors = registry.counter(
+    "bot_api_request_errors_total", "Failed Telegram Bot API requests.", ["method", "error"]
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing every handler call (register on the dispatcher's observers)."""
+    
+    def __init__(self, event: str):
+        self.event = event
+    
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors.inc(event=self.event, handler=name)
+            raise
+        finally:
+            update_duration.observe(time.perf_counter() - start, event=self.event, handler=name)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing every Telegram Bot API request."""
+    
+    async def __call__(self, make_request: Callable, bot: Any, method: TelegramMethod) -> Any:
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            api_duration.observe(time.perf_counter() - start, method=name)
+
+
+def setup_metrics(dp: Any, bot: Any, observers: Optional[Iterable[str]] = None):
+    """Install the handler and request middlewares on a dispatcher and bot."""
+    for event in observers or ("message", "callback_query"):
+        dp.observers[event].middleware(HandlerMetricsMiddleware(event))
+    bot.session.middleware(RequestMetricsMiddleware())
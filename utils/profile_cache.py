@@ -0,0 +1,109 @@
+"""
+Bounded LRU/TTL cache of user profiles (anonymous ID, blocked flag, counselor role).
+Database writes to users and counselors invalidate the affected entry.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Iterable, Tuple
+
+from database import AsyncDatabase, add_profile_listener
+import config
+
+db = AsyncDatabase()
+
+
+class ProfileCache:
+    """LRU cache of get_user_profile results with a per-entry time-to-live."""
+    
+    def __init__(self, maxsize: int = config.PROFILE_CACHE_SIZE, ttl: float = config.PROFILE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        # Invalidations come from the database thread
+        self._lock = threading.Lock()
+        self._invalidations = 0
+    
+    def _lookup(self, telegram_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[telegram_id]
+                return None
+            self._entries.move_to_end(telegram_id)
+            return entry[1]
+    
+    def _store(self, profiles: Iterable[Dict], generation: int):
+        with self._lock:
+            # Skip results read before an invalidation; they may be stale
+            if generation != self._invalidations:
+                return
+            expires_at = time.monotonic() + self.ttl
+            for profile in profiles:
+                self._entries[profile["telegram_id"]] = (expires_at, profile)
+                self._entries.move_to_end(profile["telegram_id"])
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, telegram_id: int):
+        """Drop a cached profile."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(telegram_id, None)
+    
+    def clear(self):
+        """Drop all cached profiles."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+    
+    async def get(self, telegram_id: int) -> Dict:
+        """Get a user's profile, loading it on a miss."""
+        profile = self._lookup(telegram_id)
+        if profile is None:
+            generation = self._invalidations
+            profile = await db.get_user_profile(telegram_id)
+            self._store([profile], generation)
+        return profile
+    
+    async def get_many(self, telegram_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Get profiles for many users with at most one database call."""
+        profiles = {}
+        missing = []
+        for telegram_id in dict.fromkeys(telegram_ids):
+            profile = self._lookup(telegram_id)
+            if profile is None:
+                missing.append(telegram_id)
+            else:
+                profiles[telegram_id] = profile
+        if missing:
+            generation = self._invalidations
+            loaded = await db.get_user_profiles(missing)
+            self._store(loaded.values(), generation)
+            profiles.update(loaded)
+        return profiles
+    
+    # Convenience accessors used by the handlers
+    async def get_anonymous_id(self, telegram_id: int) -> Optional[str]:
+        """Get anonymous ID for a user."""
+        return (await self.get(telegram_id))["anonymous_id"]
+    
+    async def get_anonymous_ids(self, telegram_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """Get anonymous IDs for many users."""
+        profiles = await self.get_many(telegram_ids)
+        return {telegram_id: profile["anonymous_id"] for telegram_id, profile in profiles.items()}
+    
+    async def is_blocked(self, telegram_id: int) -> bool:
+        """Check if a user is blocked."""
+        return (await self.get(telegram_id))["is_blocked"]
+    
+    async def is_counselor(self, telegram_id: int) -> bool:
+        """Check if a user is a counselor."""
+        return (await self.get(telegram_id))["is_counselor"]
+
+
+profile_cache = ProfileCache()
+add_profile_listener(profile_cache.invalidate)
@@ -0,0 +1,153 @@
+"""
+Query accounting for the database layer.
+
+When enabled, every SQL statement executed by a pooled connection is counted
+against the active QueryAccount, along with the time spent in Database methods.
+Statements are normalized to their shape (literals replaced by ?), so a
+handler running the same query once per row (N+1) shows up as one repeated
+shape.
+
+Production: set QUERY_ACCOUNTING=1 to log a warning for every handler that
+repeats a query shape N_PLUS_ONE_THRESHOLD or more times.
+
+Tests: assert query budgets per handler with track_queries():
+
+    with track_queries(budget=3, max_repeats=1) as account:
+        await dp.feed_update(bot, update)
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Read by ConnectionManager, which installs the statement hook on its connections
+enabled = config.QUERY_ACCOUNTING
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"IN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def shape(sql: str) -> str:
+    """Normalize a statement so queries differing only in values compare equal."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by track_queries() when a block runs more queries than allowed."""
+
+
+class QueryAccount:
+    """Statements and database time of one handler call or track_queries() block."""
+    
+    def __init__(self, label: str, parent: Optional["QueryAccount"] = None):
+        self.label = label
+        self.parent = parent
+        self.statements: List[str] = []
+        self.shapes: Counter = Counter()
+        self.calls: Counter = Counter()
+        self.seconds = 0.0
+    
+    @property
+    def count(self) -> int:
+        """Number of statements executed."""
+        return len(self.statements)
+    
+    def repeated(self, threshold: int = 2) -> Dict[str, int]:
+        """Query shapes executed at least `threshold` times."""
+        return {sql: n for sql, n in self.shapes.most_common() if n >= threshold}
+    
+    def report(self) -> str:
+        lines = [f"{self.label}: {self.count} queries in {self.seconds * 1000:.1f} ms"]
+        for sql, n in self.shapes.most_common():
+            lines.append(f"  {n}x {sql}")
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[QueryAccount]] = ContextVar("query_account", default=None)
+
+
+def record_statement(sql: str):
+    """SQLite trace callback: count a statement against the active accounts."""
+    account = _current.get()
+    if account is None:
+        return
+    normalized = shape(sql)
+    while account is not None:
+        account.statements.append(sql)
+        account.shapes[normalized] += 1
+        account = account.parent
+
+
+def record_call(method: str, seconds: float):
+    """Add the time of a Database method call to the active accounts."""
+    account = _current.get()
+    while account is not None:
+        account.calls[method] += 1
+        account.seconds += seconds
+        account = account.parent
+
+
+@contextmanager
+def track_queries(label: str = "block", budget: Optional[int] = None,
+                  max_repeats: Optional[int] = None) -> Iterator[QueryAccount]:
+    """
+    Count the queries run inside the block (including in the database thread).
+    Raises QueryBudgetExceeded if more than `budget` statements run, or if any
+    statement shape runs more than `max_repeats` times.
+    """
+    global enabled
+    was_enabled = enabled
+    enabled = True
+    account = QueryAccount(label, parent=_current.get())
+    token = _current.set(account)
+    try:
+        yield account
+    finally:
+        _current.reset(token)
+        enabled = was_enabled
+    if budget is not None and account.count > budget:
+        raise QueryBudgetExceeded(f"{account.count} queries, budget {budget}\n{account.report()}")
+    if max_repeats is not None and account.repeated(max_repeats + 1):
+        raise QueryBudgetExceeded(f"Query repeated more than {max_repeats} times\n{account.report()}")
+
+
+class QueryAccountingMiddleware(BaseMiddleware):
+    """Inner middleware: one account per handler call, warning about N+1 patterns."""
+    
+    def __init__(self, threshold: int = config.N_PLUS_ONE_THRESHOLD):
+        self.threshold = threshold
+    
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        if not enabled:
+            return await handler(event, data)
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        account = QueryAccount(name, parent=_current.get())
+        token = _current.set(account)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            for sql, n in account.repeated(self.threshold).items():
+                logger.warning(f"Possible N+1 in {name}: {n}x {sql}")
+            logger.debug(f"{name}: {account.count} queries in {account.seconds * 1000:.1f} ms")
+
+
+def setup_query_accounting(dp: Any, observers: Optional[List[str]] = None):
+    """Install the accounting middleware on a dispatcher's handlers."""
+    for event in observers or ("message", "callback_query"):
+        dp.observers[event].middleware(QueryAccountingMiddleware())
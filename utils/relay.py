@@ -0,0 +1,272 @@
+"""
+Relay engine for chat session messages.
+Saves a message of any content type and delivers it to the other side of the
+session under an anonymous header. Media is sent with copy_message, so files
+are never downloaded or uploaded again. Albums are collected for a moment and
+sent as one media group.
+"""
+
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram.methods import CopyMessage, SendMediaGroup, SendMessage
+from aiogram.types import (
+    InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message, MessageEntity
+)
+
+from utils.delivery import delivery
+from utils.message_journal import message_journal
+from utils.relay_index import relay_index
+import config
+
+logger = logging.getLogger(__name__)
+
+ErrorCallback = Callable[[Exception], Awaitable[None]]
+SentCallback = Callable[[], Awaitable[None]]
+
+# Header labels per content type
+LABELS = {
+    "text": "💬 Message",
+    "photo": "📷 Photo",
+    "video": "🎥 Video",
+    "animation": "🎞 GIF",
+    "audio": "🎵 Audio",
+    "voice": "🎤 Voice message",
+    "video_note": "📹 Video message",
+    "document": "📄 Document",
+    "sticker": "🖼 Sticker",
+    "location": "📍 Location",
+    "venue": "📍 Place",
+    "contact": "👤 Contact",
+    "poll": "📊 Poll",
+    "dice": "🎲 Dice",
+}
+
+# Types whose copy can carry the header in its caption
+CAPTIONED = {"photo", "video", "animation", "audio", "voice", "document"}
+
+# Album parts, by content type
+ALBUM_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+# Telegram's length limits
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+
+def describe(message: Message) -> Tuple[str, Optional[str], Optional[str]]:
+    """Get (message_type, content, file_id) to store for a message of any type."""
+    message_type = message.content_type
+    content = message.text if message.text is not None else message.caption
+    file_id = None
+    
+    if message.photo:
+        file_id = message.photo[-1].file_id
+    else:
+        media = getattr(message, message_type, None)
+        file_id = getattr(media, "file_id", None)
+    
+    if message.sticker:
+        content = message.sticker.emoji
+    elif message.venue:
+        content = f"{message.venue.title}, {message.venue.address}"
+    elif message.location:
+        content = f"{message.location.latitude},{message.location.longitude}"
+    elif message.contact:
+        name = " ".join(filter(None, [message.contact.first_name, message.contact.last_name]))
+        content = f"{name} {message.contact.phone_number}"
+    elif message.poll:
+        content = message.poll.question
+    elif message.dice:
+        content = f"{message.dice.emoji} {message.dice.value}"
+    
+    return message_type, content, file_id
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram measures entity offsets in UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _shift(entities: Optional[List[MessageEntity]], offset: int) -> Optional[List[MessageEntity]]:
+    if not entities:
+        return None
+    return [entity.model_copy(update={"offset": entity.offset + offset}) for entity in entities]
+
+
+async def _relay_single(message: Message, session_id: int, to_chat_id: int, sender_name: str) -> List[int]:
+    """Save one message and deliver it. Returns the IDs of the delivered messages."""
+    message_type, content, file_id = describe(message)
+    await message_journal.append(session_id, message.from_user.id, message_type, content, file_id)
+    
+    header = f"{LABELS.get(message_type, LABELS['text'])} from {sender_name}"
+    
+    # Text: one message with the header prepended
+    if message_type == "text":
+        prefix = f"{header}:\n\n"
+        if len(prefix) + len(message.text) <= TEXT_LIMIT:
+            sent = await delivery.send(SendMessage(
+                chat_id=to_chat_id,
+                text=prefix + message.text,
+                entities=_shift(message.entities, _utf16_len(prefix))
+            ))
+            return [sent.message_id]
+    
+    # Captioned media: copy with the header in the caption
+    if message_type in CAPTIONED:
+        prefix = f"{header}:\n" if message.caption else header
+        caption = prefix + (message.caption or "")
+        if len(caption) <= CAPTION_LIMIT:
+            sent = await delivery.send(CopyMessage(
+                chat_id=to_chat_id,
+                from_chat_id=message.chat.id,
+                message_id=message.message_id,
+                caption=caption,
+                caption_entities=_shift(message.caption_entities, _utf16_len(prefix))
+            ))
+            return [sent.message_id]
+    
+    # Anything else (or too long to prepend to): header message, then an exact copy
+    header_message = await delivery.send(SendMessage(chat_id=to_chat_id, text=f"{header}:"))
+    sent = await delivery.send(CopyMessage(
+        chat_id=to_chat_id,
+        from_chat_id=message.chat.id,
+        message_id=message.message_id
+    ))
+    return [header_message.message_id, sent.message_id]
+
+
+class _Album:
+    def __init__(self, session_id: int, to_chat_id: int, sender_name: str,
+                 index_replies: bool, on_error: Optional[ErrorCallback], on_sent: Optional[SentCallback]):
+        self.session_id = session_id
+        self.to_chat_id = to_chat_id
+        self.sender_name = sender_name
+        self.index_replies = index_replies
+        self.on_error = on_error
+        self.on_sent = on_sent
+        self.parts: List[Message] = []
+
+
+class AlbumCollector:
+    """
+    Buffers the parts of a media group (each arrives as its own update) until
+    none has arrived for `wait_ms`, then relays them with one send_media_group.
+    """
+    
+    def __init__(self, wait_ms: int = config.MEDIA_GROUP_WAIT_MS):
+        self.wait = wait_ms / 1000
+        self._albums: Dict[Tuple[int, str], _Album] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def add(self, message: Message, session_id: int, to_chat_id: int, sender_name: str,
+            index_replies: bool = False, on_error: Optional[ErrorCallback] = None,
+            on_sent: Optional[SentCallback] = None):
+        """
+        Buffer an album part; the album is relayed in the background.
+        The callbacks given with the first part apply to the whole album.
+        """
+        key = (message.chat.id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = _Album(
+                session_id, to_chat_id, sender_name, index_replies, on_error, on_sent
+            )
+            # Sent after the window, not as part of this update's trace
+            task = asyncio.create_task(self._collect(key, album), context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        album.parts.append(message)
+    
+    async def drain(self):
+        """Wait for buffered albums to be relayed (called on shutdown)."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+    
+    async def _collect(self, key: Tuple[int, str], album: _Album):
+        # Wait until the album stops growing
+        while True:
+            count = len(album.parts)
+            await asyncio.sleep(self.wait)
+            if len(album.parts) == count:
+                break
+        del self._albums[key]
+        try:
+            sent_ids = await self._send(album)
+        except Exception as e:
+            if album.on_error is None:
+                logger.error(f"Error relaying album: {e}")
+            else:
+                await album.on_error(e)
+            return
+        if album.index_replies:
+            for sent_id in sent_ids:
+                relay_index.record(album.to_chat_id, sent_id, album.session_id)
+        if album.on_sent is not None:
+            await album.on_sent()
+    
+    async def _send(self, album: _Album) -> List[int]:
+        parts = sorted(album.parts, key=lambda part: part.message_id)
+        if len(parts) == 1 or any(part.content_type not in ALBUM_MEDIA for part in parts):
+            sent_ids = []
+            for part in parts:
+                sent_ids += await _relay_single(part, album.session_id, album.to_chat_id, album.sender_name)
+            return sent_ids
+        
+        # Journal all parts together, so they are written in one batch
+        for part in parts:
+            message_type, content, file_id = describe(part)
+            await message_journal.append(album.session_id, part.from_user.id, message_type, content, file_id)
+        
+        sent_ids = []
+        header = f"🖼 Album from {album.sender_name}"
+        first = parts[0]
+        prefix = f"{header}:\n" if first.caption else header
+        caption = prefix + (first.caption or "")
+        if len(caption) > CAPTION_LIMIT:
+            header_message = await delivery.send(SendMessage(chat_id=album.to_chat_id, text=f"{header}:"))
+            sent_ids.append(header_message.message_id)
+            caption, prefix = first.caption, ""
+        
+        media = []
+        for part in parts:
+            message_type, _, file_id = describe(part)
+            if part is first:
+                item_caption, entities = caption, _shift(part.caption_entities, _utf16_len(prefix))
+            else:
+                item_caption, entities = part.caption, part.caption_entities
+            media.append(ALBUM_MEDIA[message_type](media=file_id, caption=item_caption, caption_entities=entities))
+        sent = await delivery.send(SendMediaGroup(chat_id=album.to_chat_id, media=media))
+        return sent_ids + [message.message_id for message in sent]
+
+
+albums = AlbumCollector()
+
+
+async def relay_message(message: Message, session_id: int, to_chat_id: int, sender_name: str,
+                        index_replies: bool = False, on_error: Optional[ErrorCallback] = None,
+                        on_sent: Optional[SentCallback] = None):
+    """
+    Save a session message and deliver it to to_chat_id, headed
+    "<label> from <sender_name>". With index_replies, replies to the delivered
+    messages are routed back to the session (see utils.relay_index).
+    
+    on_sent is awaited once the message is delivered. Errors are raised,
+    except for album parts: those are relayed in the background, so on_sent
+    runs when the whole album is out and errors are passed to on_error.
+    """
+    if message.media_group_id:
+        albums.add(message, session_id, to_chat_id, sender_name, index_replies, on_error, on_sent)
+        return
+    sent_ids = await _relay_single(message, session_id, to_chat_id, sender_name)
+    if index_replies:
+        for sent_id in sent_ids:
+            relay_index.record(to_chat_id, sent_id, session_id)
+    if on_sent is not None:
+        await on_sent()
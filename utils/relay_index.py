@@ -0,0 +1,83 @@
+"""
+Index of messages relayed to counselors.
+Maps (counselor chat ID, message ID) to the chat session, so a counselor can
+answer a user by replying to any message the bot relayed from them. Recent
+mappings are kept in an LRU; new ones are written to the relay_messages table
+in batches.
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from database import AsyncDatabase
+import config
+
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
+
+
+class RelayIndex:
+    """LRU of relayed message -> session ID, backed by the database."""
+    
+    def __init__(self, maxsize: int = config.RELAY_INDEX_CACHE_SIZE,
+                 flush_interval_ms: int = config.MESSAGE_FLUSH_INTERVAL_MS):
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval_ms / 1000
+        self._entries: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._pending: List[Tuple[int, int, int]] = []
+        self._flusher: Optional[asyncio.Task] = None
+    
+    def _remember(self, key: Tuple[int, int], session_id: int):
+        self._entries[key] = session_id
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def record(self, chat_id: int, message_id: int, session_id: int):
+        """Remember that a message sent to chat_id belongs to a session."""
+        self._remember((chat_id, message_id), session_id)
+        self._pending.append((chat_id, message_id, session_id))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later(), context=contextvars.Context())
+    
+    async def lookup(self, chat_id: int, message_id: int) -> Optional[int]:
+        """Get the session ID for a relayed message, or None if it is not one."""
+        key = (chat_id, message_id)
+        session_id = self._entries.get(key)
+        if session_id is not None:
+            self._entries.move_to_end(key)
+            return session_id
+        session_id = await db.get_relay_session(chat_id, message_id)
+        if session_id is not None:
+            self._remember(key, session_id)
+        return session_id
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+    
+    async def flush(self):
+        """Write pending mappings now."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        if not await db.save_relay_messages(batch):
+            # Try again with the next write
+            self._pending = batch + self._pending
+    
+    async def close(self):
+        """Write pending mappings (called on shutdown)."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+relay_index = RelayIndex()
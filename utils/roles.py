@@ -0,0 +1,67 @@
+"""
+Sender roles.
+An outer update middleware resolves the roles of the sender once per update,
+from config.ADMIN_ID and the profile cache, and passes them to filters and
+handlers as `roles`. Handlers check membership instead of querying again:
+
+    @router.message(F.text.isdigit(), HasRole(COUNSELOR))
+    async def handler(message: Message, roles: FrozenSet[str]): ...
+"""
+
+from typing import Any, Callable, Dict, FrozenSet, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.types import User
+
+from utils.profile_cache import profile_cache
+import config
+
+ADMIN = "admin"
+COUNSELOR = "counselor"
+USER = "user"
+BLOCKED = "blocked"
+
+NO_ROLES: FrozenSet[str] = frozenset()
+
+
+async def resolve_roles(user_id: int) -> FrozenSet[str]:
+    """
+    Roles of a Telegram user: admin and/or counselor, else user; plus blocked
+    whenever the account is blocked, whatever its other roles.
+    """
+    profile = await profile_cache.get(user_id)
+    roles = set()
+    if user_id == config.ADMIN_ID:
+        roles.add(ADMIN)
+    if profile["is_counselor"]:
+        roles.add(COUNSELOR)
+    if not roles:
+        roles.add(USER)
+    if profile["is_blocked"]:
+        roles.add(BLOCKED)
+    return frozenset(roles)
+
+
+class RoleMiddleware(BaseMiddleware):
+    """Outer update middleware putting the sender's roles in the handler data."""
+    
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        data["roles"] = await resolve_roles(user.id) if user is not None else NO_ROLES
+        return await handler(event, data)
+
+
+class HasRole(Filter):
+    """Filter: the sender has any of the given roles (no database access)."""
+    
+    def __init__(self, *roles: str):
+        self.roles = frozenset(roles)
+    
+    async def __call__(self, event: Any, roles: FrozenSet[str] = NO_ROLES) -> bool:
+        return not self.roles.isdisjoint(roles)
+
+
+def setup_roles(dp: Any):
+    """Install the role middleware on a dispatcher."""
+    dp.update.outer_middleware(RoleMiddleware())
@@ -0,0 +1,176 @@
+"""
+In-memory registry of active chat sessions.
+Loaded once at startup and kept authoritative for the message relay path;
+creating and finishing sessions writes through to the database.
+With several worker processes (config.WORKERS > 1) sessions can change in
+another process, so nothing is cached: reads go to the database and writes
+only notify the listeners.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Optional, List, Dict
+
+from database import AsyncDatabase
+from utils import metrics
+import config
+
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
+
+
+class SessionRegistry:
+    """Active sessions indexed by session ID, user ID and counselor ID."""
+    
+    def __init__(self, database: AsyncDatabase = db, shared: bool = config.WORKERS > 1):
+        self.db = database
+        self.shared = shared  # the database is shared with other processes; don't cache
+        self.loaded = False
+        self._by_id: Dict[int, Dict] = {}
+        self._by_user: Dict[int, Dict] = {}
+        self._by_counselor: Dict[int, Dict[int, Dict]] = {}
+        self._listeners: List = []
+    
+    def add_listener(self, listener):
+        """Register an object with session_opened(session) / session_closed(session) callbacks."""
+        self._listeners.append(listener)
+    
+    async def load(self):
+        """(Re)load all active sessions from the database."""
+        sessions = await self.db.get_all_active_sessions()
+        self._by_id.clear()
+        self._by_user.clear()
+        self._by_counselor.clear()
+        # Oldest first so a user's newest session wins, as in get_active_session
+        for session in reversed(sessions):
+            self._add(dict(session, status="active"))
+        self.loaded = True
+        logger.info(f"Session registry loaded {len(sessions)} active sessions")
+    
+    async def _ensure_loaded(self):
+        if not self.loaded:
+            await self.load()
+    
+    def _opened(self, session: Dict):
+        for listener in self._listeners:
+            listener.session_opened(session)
+    
+    def _closed(self, session: Dict):
+        for listener in self._listeners:
+            listener.session_closed(session)
+    
+    def _add(self, session: Dict):
+        self._by_id[session["session_id"]] = session
+        self._by_user[session["user_telegram_id"]] = session
+        self._by_counselor.setdefault(session["counselor_telegram_id"], {})[session["session_id"]] = session
+    
+    def _remove(self, session_id: int) -> Optional[Dict]:
+        session = self._by_id.pop(session_id, None)
+        if session is None:
+            return None
+        if self._by_user.get(session["user_telegram_id"]) is session:
+            del self._by_user[session["user_telegram_id"]]
+        counselor_sessions = self._by_counselor.get(session["counselor_telegram_id"], {})
+        counselor_sessions.pop(session_id, None)
+        if not counselor_sessions:
+            self._by_counselor.pop(session["counselor_telegram_id"], None)
+        return session
+    
+    # Reads
+    async def get_active_session(self, user_telegram_id: int) -> Optional[Dict]:
+        """Get the active session for a user."""
+        if self.shared:
+            return await self.db.get_active_session(user_telegram_id)
+        await self._ensure_loaded()
+        return self._by_user.get(user_telegram_id)
+    
+    async def get_session(self, session_id: int) -> Optional[Dict]:
+        """Get a session by ID; finished sessions are read from the database."""
+        if self.shared:
+            return await self.db.get_session_by_id(session_id)
+        await self._ensure_loaded()
+        session = self._by_id.get(session_id)
+        if session is None:
+            session = await self.db.get_session_by_id(session_id)
+        return session
+    
+    async def get_counselor_sessions(self, counselor_telegram_id: int) -> List[Dict]:
+        """Get a counselor's active sessions, newest first."""
+        if self.shared:
+            return await self.db.get_counselor_sessions(counselor_telegram_id)
+        await self._ensure_loaded()
+        sessions = self._by_counselor.get(counselor_telegram_id, {}).values()
+        return sorted(sessions, key=lambda s: (s["created_at"], s["session_id"]), reverse=True)
+    
+    async def get_all_active_sessions(self) -> List[Dict]:
+        """Get all active sessions, newest first."""
+        if self.shared:
+            return await self.db.get_all_active_sessions()
+        await self._ensure_loaded()
+        return sorted(self._by_id.values(), key=lambda s: (s["created_at"], s["session_id"]), reverse=True)
+    
+    async def count_by_category(self) -> Dict[tuple, int]:
+        """Count active sessions per category (label values -> count, for metrics)."""
+        counts: Dict[tuple, int] = {}
+        for session in await self.get_all_active_sessions():
+            key = (session["category"],)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+    
+    # Writes
+    async def create_session(self, user_telegram_id: int, counselor_telegram_id: int, category: str) -> Optional[int]:
+        """Create a session in the database and register it. Returns session_id."""
+        if not self.shared:
+            await self._ensure_loaded()
+        session_id = await self.db.create_chat_session(user_telegram_id, counselor_telegram_id, category)
+        if session_id is None:
+            return None
+        session = {
+            "session_id": session_id,
+            "user_telegram_id": user_telegram_id,
+            "counselor_telegram_id": counselor_telegram_id,
+            "category": category,
+            "status": "active",
+            # Same format as SQLite's CURRENT_TIMESTAMP
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        }
+        # Shared: another worker may finish it, so it is not kept here
+        if not self.shared:
+            self._add(session)
+        self._opened(session)
+        return session_id
+    
+    async def finish_session(self, session_id: int) -> bool:
+        """Mark a session finished in the database and unregister it."""
+        if self.shared:
+            session = await self.db.get_session_by_id(session_id)
+            if not await self.db.finish_session(session_id):
+                return False
+            if session is not None and session["status"] == "active":
+                self._closed(session)
+            return True
+        await self._ensure_loaded()
+        if not await self.db.finish_session(session_id):
+            return False
+        session = self._remove(session_id)
+        if session is not None:
+            self._closed(session)
+        return True
+    
+    async def expire_idle_sessions(self, idle_since: datetime) -> List[Dict]:
+        """Finish all sessions without messages since `idle_since` (UTC) and unregister them."""
+        if not self.shared:
+            await self._ensure_loaded()
+        expired = await self.db.expire_idle_sessions(idle_since.strftime("%Y-%m-%d %H:%M:%S"))
+        for session in expired:
+            if not self.shared:
+                session = self._remove(session["session_id"]) or session
+            self._closed(session)
+        return expired
+
+
+session_registry = SessionRegistry()
+metrics.registry.gauge(
+    "bot_active_sessions", "Active chat sessions.", session_registry.count_by_category, ["category"]
+)
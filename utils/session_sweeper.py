@@ -0,0 +1,146 @@
+"""
+Idle session sweeper.
+A background task that periodically finishes sessions with no message for
+SESSION_IDLE_TIMEOUT_MINUTES, with one bulk UPDATE, and tells both sides:
+each user gets a notice and each counselor one message listing all of their
+closed sessions. All notices are queued on the delivery dispatcher at once.
+With several workers only one sweeps; it reads users' languages from the
+shared FSM table and gives the other workers time to write their journals.
+"""
+
+import asyncio
+import contextvars
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.methods import SendMessage
+
+from database import AsyncDatabase
+from utils.session_registry import session_registry
+from utils.profile_cache import profile_cache
+from utils.delivery import delivery, PRIORITY_CONTROL
+from utils.message_journal import message_journal
+from utils import metrics
+from keyboards.menus import get_main_menu_keyboard
+import config
+
+logger = logging.getLogger(__name__)
+
+db = AsyncDatabase()
+
+sessions_reaped = metrics.registry.counter(
+    "bot_sessions_reaped_total", "Sessions finished by the idle session sweeper."
+)
+
+
+class SessionSweeper:
+    """Finishes idle sessions every `interval_seconds`."""
+    
+    def __init__(self, idle_minutes: int = config.SESSION_IDLE_TIMEOUT_MINUTES,
+                 interval_seconds: int = config.SESSION_SWEEP_INTERVAL_SECONDS):
+        self.idle = timedelta(minutes=idle_minutes)
+        self.interval = interval_seconds
+        self.reaped = 0  # sessions finished since start
+        self._storage: Optional[BaseStorage] = None
+        self._bot_id = 0
+        self._user_state: Optional[State] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, storage: Optional[BaseStorage] = None, bot_id: int = 0, user_state: Optional[State] = None):
+        """
+        Start sweeping in the background (no-op if the idle timeout is 0).
+        With a storage, users are moved to `user_state`; without one (worker
+        mode, where other workers own the FSM states) their states are left
+        alone and their languages are read from the stored FSM data.
+        """
+        if not self.idle or (self._task is not None and not self._task.done()):
+            return
+        self._storage = storage
+        self._bot_id = bot_id
+        self._user_state = user_state
+        # Long-lived: start it outside the current update's context
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+    
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping idle sessions: {e}")
+    
+    async def sweep(self) -> int:
+        """Finish idle sessions now and notify both sides. Returns how many were finished."""
+        # Messages still queued count as activity
+        await message_journal.flush()
+        if session_registry.shared:
+            # Other workers' journals are written at least every flush interval
+            # (allow one more for a batch in flight); wait for them to land
+            await asyncio.sleep(2 * config.MESSAGE_FLUSH_INTERVAL_MS / 1000)
+        idle_since = datetime.now(timezone.utc) - self.idle
+        expired = await session_registry.expire_idle_sessions(idle_since)
+        if not expired:
+            return 0
+        self.reaped += len(expired)
+        sessions_reaped.inc(len(expired))
+        logger.info(f"Finished {len(expired)} idle sessions")
+        await self._notify(expired)
+        return len(expired)
+    
+    async def _reset_users(self, user_ids: List[int]) -> Dict[int, str]:
+        """Move users out of the chat state; returns their languages."""
+        if self._storage is None:
+            return await db.get_fsm_languages(self._bot_id, user_ids)
+        languages = {}
+        for user_id in user_ids:
+            key = StorageKey(bot_id=self._bot_id, chat_id=user_id, user_id=user_id)
+            if self._user_state is not None:
+                await self._storage.set_state(key, self._user_state)
+            languages[user_id] = (await self._storage.get_data(key)).get("language", "en")
+        return languages
+    
+    async def _notify(self, expired: List[Dict]):
+        user_ids = [session["user_telegram_id"] for session in expired]
+        anonymous_ids = await profile_cache.get_anonymous_ids(user_ids)
+        languages = await self._reset_users(user_ids)
+        minutes = int(self.idle.total_seconds() // 60)
+        
+        sends = []
+        by_counselor: Dict[int, List[str]] = {}
+        for session in expired:
+            user_id = session["user_telegram_id"]
+            lang = languages.get(user_id, "en")
+            sends.append(SendMessage(
+                chat_id=user_id,
+                text=config.STRINGS["session_expired"][lang],
+                reply_markup=get_main_menu_keyboard(lang)
+            ))
+            by_counselor.setdefault(session["counselor_telegram_id"], []).append(anonymous_ids[user_id])
+        for counselor_id, users in by_counselor.items():
+            sends.append(SendMessage(
+                chat_id=counselor_id,
+                text=f"ℹ️ Closed after {minutes} minutes without messages: {', '.join(users)}"
+            ))
+        
+        results = await asyncio.gather(
+            *(delivery.send(method, priority=PRIORITY_CONTROL) for method in sends), return_exceptions=True
+        )
+        for method, result in zip(sends, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error notifying {method.chat_id} of an idle session: {result}")
+
+
+session_sweeper = SessionSweeper()
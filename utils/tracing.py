@@ -0,0 +1,133 @@
+"""
+Per-update tracing.
+An outer middleware times each update end to end and attributes the time to
+database calls, Telegram API calls and the rest (handler code, filters,
+middlewares). Updates slower than SLOW_UPDATE_THRESHOLD_MS are logged with
+the breakdown as one JSON record.
+"""
+
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+import config
+
+logger = logging.getLogger("slow_updates")
+
+
+class Trace:
+    """Time spent by one update, per kind ("db", "api") and name (method)."""
+    
+    def __init__(self, update: Update):
+        self.update = update
+        self.started = time.perf_counter()
+        self.handler: Optional[str] = None
+        self.active = True
+        # kind -> name -> [calls, seconds]
+        self.spans: Dict[str, Dict[str, List[float]]] = {"db": {}, "api": {}}
+    
+    def add(self, kind: str, name: str, seconds: float):
+        # Background work started by the update may finish after it
+        if not self.active:
+            return
+        entry = self.spans[kind].setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    
+    def summary(self, total: float) -> Dict[str, Any]:
+        """Breakdown of the update's time, in milliseconds."""
+        record: Dict[str, Any] = {
+            "update_id": self.update.update_id,
+            "event": self.update.event_type,
+            "user_id": _user_id(self.update),
+            "handler": self.handler,
+            "total_ms": round(total * 1000, 1),
+        }
+        accounted = 0.0
+        for kind, spans in self.spans.items():
+            seconds = sum(entry[1] for entry in spans.values())
+            accounted += seconds
+            record[f"{kind}_ms"] = round(seconds * 1000, 1)
+            record[f"{kind}_calls"] = sum(entry[0] for entry in spans.values())
+            record[kind] = {
+                name: {"calls": entry[0], "ms": round(entry[1] * 1000, 1)}
+                for name, entry in sorted(spans.items(), key=lambda item: -item[1][1])
+            }
+        record["other_ms"] = round(max(0.0, total - accounted) * 1000, 1)
+        return record
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    """Get the trace of the update being handled, if any."""
+    return _current.get()
+
+
+def record(kind: str, name: str, seconds: float):
+    """Attribute time to the current update (no-op outside an update)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(kind, name, seconds)
+
+
+def _user_id(update: Update) -> Optional[int]:
+    user = getattr(update.event, "from_user", None)
+    return user.id if user is not None else None
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer update middleware: times the whole update and logs slow ones."""
+    
+    def __init__(self, threshold_ms: float = config.SLOW_UPDATE_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+    
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
+        trace = Trace(event)
+        token = _current.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            trace.active = False
+            total = time.perf_counter() - trace.started
+            if total >= self.threshold:
+                logger.warning(f"Slow update {json.dumps(trace.summary(total), ensure_ascii=False)}")
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner middleware recording which handler took the update."""
+    
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        trace = _current.get()
+        handler_object = data.get("handler")
+        if trace is not None and handler_object is not None:
+            trace.handler = handler_object.callback.__name__
+        return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Bot session middleware attributing API requests made while handling an update."""
+    
+    async def __call__(self, make_request: Callable, bot: Any, method: TelegramMethod) -> Any:
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            record("api", type(method).__name__, time.perf_counter() - start)
+
+
+def setup_tracing(dp: Any, bot: Any, observers: Optional[List[str]] = None):
+    """Install the tracing middlewares on a dispatcher and bot."""
+    dp.update.outer_middleware(TracingMiddleware())
+    for event in observers or ("message", "callback_query"):
+        dp.observers[event].middleware(HandlerNameMiddleware())
+    bot.session.middleware(TracingRequestMiddleware())
@@ -0,0 +1,124 @@
+"""
+aiohttp web server for the Anonymous Telegram Counseling Bot.
+Serves the health check in every mode and receives Telegram updates in webhook mode,
+all on the bot's own event loop.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def health(request: web.Request) -> web.Response:
+    """Health check for the hosting platform."""
+    return web.Response(text="Alive")
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus metrics of this process."""
+    return web.Response(
+        text=await metrics.registry.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that answers Telegram immediately and processes updates in
+    the background, with at most `max_concurrent` updates in flight. When the
+    limit is reached the HTTP response waits, which pushes back on Telegram.
+    """
+    
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent: int, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(max_concurrent)
+    
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        task.add_done_callback(lambda _: self._slots.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+def create_app(dp: Dispatcher = None, bot: Bot = None) -> web.Application:
+    """Build the web application; pass dp and bot to also receive webhook updates."""
+    app = web.Application()
+    app.router.add_get("/", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    if dp is not None:
+        BoundedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            max_concurrent=config.WEBHOOK_MAX_CONCURRENT_UPDATES,
+            secret_token=config.WEBHOOK_SECRET
+        ).register(app, path=config.WEBHOOK_PATH)
+        # Emit the dispatcher's startup/shutdown events with the app
+        setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_server(app: web.Application, port: int = config.WEB_SERVER_PORT) -> web.AppRunner:
+    """Start serving an app on WEB_SERVER_HOST:port."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEB_SERVER_HOST, port=port)
+    await site.start()
+    logger.info(f"Web server listening on {config.WEB_SERVER_HOST}:{port}")
+    return runner
+
+
+def create_routing_app(route: Callable[[Dict[str, Any]], None]) -> web.Application:
+    """Build a web application that passes each verified webhook update to `route` as a dict."""
+    app = web.Application()
+    app.router.add_get("/", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    
+    async def receive(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.WEBHOOK_SECRET:
+            return web.Response(status=401, text="Unauthorized")
+        route(await request.json())
+        return web.json_response({})
+    
+    app.router.add_post(config.WEBHOOK_PATH, receive)
+    return app
+
+
+async def serve_webhook(bot: Bot, app: web.Application):
+    """Serve an app, register the webhook with Telegram and wait until cancelled."""
+    runner = await start_server(app)
+    try:
+        await bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=True
+        )
+        logger.info("Webhook registered, waiting for updates")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Register the webhook with Telegram and serve updates until cancelled."""
+    await serve_webhook(bot, create_app(dp, bot))
+
+
+async def run_polling(dp: Dispatcher, bot: Bot):
+    """Poll Telegram for updates while serving the health check."""
+    runner = await start_server(create_app())
+    try:
+        await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await runner.cleanup()